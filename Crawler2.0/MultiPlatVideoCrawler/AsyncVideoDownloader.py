@@ -0,0 +1,213 @@
+import asyncio
+import time
+from threading import Thread
+
+import aiohttp
+
+from MultiPlatVideoCrawler.MirrorSelector import mirror_selector
+from MultiPlatVideoCrawler.VideoMultiThreadDownloader import VideoMultiThreadDownloader
+from MultiPlatVideoCrawler.conf.config import ASYNC_DOWNLOAD_CONCURRENCY, DOWNLOAD_QUEUE_SIZE, DOWNLOAD_TIMEOUT, \
+    HTTP_HOST_POOL_SIZE, HTTP_POOL_MAXSIZE, HTTP_DNS_CACHE_TTL, VALIDATE_RETRIES
+from MultiPlatVideoCrawler.utils.aimd import is_congestion
+from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.metrics import metrics, host_of
+from MultiPlatVideoCrawler.utils.ratelimit import rate_limiter
+
+
+class AsyncVideoDownloader(VideoMultiThreadDownloader):
+    """
+    协程下载器：所有下载在同一个事件循环中进行，由信号量限制同时下载数，
+    入口与计数方式与多线程下载器相同
+    """
+
+    def __init__(self, save_path, platform, concurrency=ASYNC_DOWNLOAD_CONCURRENCY, queue_size=DOWNLOAD_QUEUE_SIZE,
+                 keyword=None):
+        self.loop = None
+        self.client = None
+        self.semaphore = None
+        self.queue_size = queue_size
+        # 协程后端不做分段下载
+        super().__init__(save_path, platform, concurrency, queue_size, stream=True, segmented=False, keyword=keyword)
+
+    def _start_workers(self) -> None:
+        """在后台线程中运行事件循环"""
+        self.loop = asyncio.new_event_loop()
+        worker = Thread(target=self.loop.run_forever, name=f"{self.platform}-downloader-loop", daemon=True)
+        worker.start()
+        self.workers.append(worker)
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+
+    async def _open(self) -> None:
+        self.semaphore = asyncio.Semaphore(self.thread_num)
+        connector = aiohttp.TCPConnector(
+            limit=self.thread_num,
+            limit_per_host=max(HTTP_POOL_MAXSIZE, *HTTP_HOST_POOL_SIZE.values(), self.thread_num // 4),
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL or None,
+            use_dns_cache=HTTP_DNS_CACHE_TTL > 0,
+        )
+        self.client = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(sock_connect=DOWNLOAD_TIMEOUT[0], sock_read=DOWNLOAD_TIMEOUT[1]),
+        )
+
+    def submit(self, video_t: tuple, timeout: float = None) -> bool:
+        """
+        提交下载任务，排队及下载中的任务数超过上限时阻塞等待
+        @param video_t: 视频链接元组(视频id, 视频链接)
+        @param timeout: 等待时间（秒），None表示一直等待
+        @return: 是否加入了下载队列
+        """
+        with self.all_done:
+            limit = self.thread_num + self.queue_size
+            if not self.all_done.wait_for(lambda: self.pending_num < limit, timeout):
+                log_warn(f"下载队列已满，丢弃视频{video_t[0]}")
+                return False
+            if not self._admit(video_t):
+                return False
+            self.pending_num += 1
+        asyncio.run_coroutine_threadsafe(self._download(video_t), self.loop)
+        return True
+
+    def cancel(self) -> int:
+        """取消所有等待中的任务（正在下载的任务会继续完成）"""
+        self.cancelled.set()
+        return 0
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        关闭下载器：不再接收新任务，已提交的任务下载完后关闭事件循环
+        @param wait: 是否等待事件循环退出
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+        def close():
+            self.join()
+            asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            log_warn(f"下载统计 {self.stats()}")
+
+        if wait:
+            close()
+            self.workers[0].join()
+        else:
+            Thread(target=close, daemon=True).start()
+
+    async def _download(self, video_t: tuple) -> None:
+        async with self.semaphore:
+            if not self._task_started(video_t):
+                return
+            try:
+                size = await self.download_video_async(video_t)
+            except Exception as e:
+                self._task_finished(video_t, error=e)
+            else:
+                self._task_finished(video_t, size)
+
+    async def download_video_async(self, video: tuple) -> int:
+        """
+        下载视频，启用视频库时先查库，库中已有则直接链接到关键字文件夹
+        @param video: 视频链接元组(视频id, 视频链接或镜像链接列表)
+        @return: 本次下载的字节数
+        """
+        if self.store is None:
+            return await self.fetch_checked_async(video, f"{self.save_path}\\{video[0]}.mp4")
+        # 查库、哈希校验和等待其他下载器都是阻塞操作，放到线程池中执行
+        loop = asyncio.get_running_loop()
+        claim = self.store.claim(self.platform, video[0])
+        await loop.run_in_executor(None, claim.__enter__)
+        try:
+            if await loop.run_in_executor(None, self.store.has, self.platform, video[0]):
+                log_warn(f"视频{video[0]}.mp4已在视频库中，跳过下载")
+                with self.lock:
+                    self.skipped_num += 1
+                size = 0
+            else:
+                size = await self.fetch_checked_async(video, self.store.path(self.platform, video[0]))
+                await loop.run_in_executor(None, self.store.add, self.platform, video[0])
+        finally:
+            claim.__exit__(None, None, None)
+        self.store.link(self.platform, video[0], self.save_path)
+        return size
+
+    async def fetch_checked_async(self, video: tuple, path: str) -> int:
+        """下载视频并立即校验，下载中断、大小不符或MP4不完整时文件移入隔离区后重新下载"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(VALIDATE_RETRIES + 1):
+            try:
+                size, expected = await self.fetch_video_async(video, path)
+            except (OSError, aiohttp.ClientError) as e:
+                error, problem = e, f"下载中断: {e}"
+            else:
+                problem = await loop.run_in_executor(None, self.check, path, size, expected)
+                if problem is None:
+                    return size
+                error = IOError(f"视频{video[0]}.mp4连续{VALIDATE_RETRIES + 1}次校验失败({problem})")
+            await loop.run_in_executor(None, self.quarantine, video[0], path, problem)
+        raise error
+
+    async def fetch_video_async(self, video: tuple, path: str) -> int:
+        """
+        按块读取响应并写入文件，镜像失败时按延迟顺序换用下一个镜像
+        @param video: 视频链接元组(视频id, 视频链接或镜像链接列表)
+        @param path: 保存路径
+        @return: (写入的字节数, 服务器声明的完整大小)，大小未知时为-1
+        """
+        urls = mirror_selector.rank([video[1]] if isinstance(video[1], str) else list(video[1]))
+        for i, url in enumerate(urls):
+            try:
+                result = await self._fetch(url, path)
+            except Exception:
+                mirror_selector.record_failure(url)
+                metrics.add(host_of(url), self.keyword, failures=1, retries=1 if i < len(urls) - 1 else 0)
+                if i == len(urls) - 1:
+                    raise
+            else:
+                log_warn(
+                    f"下载视频{video[0]}.mp4成功",
+                )
+                return result
+
+    async def _fetch(self, url: str, path: str) -> tuple:
+        host = host_of(url)
+        if self.adaptive is not None:
+            # 等待主机有空闲的并发名额，不阻塞事件循环
+            while not self.adaptive.try_acquire(host):
+                await asyncio.sleep(0.05)
+        # 拿到名额后才算正在下载，等待名额的任务计入积压
+        with self.lock:
+            self.active_num += 1
+        size, congested = 0, False
+        try:
+            size, expected = await self._fetch_url(url, path)
+            return size, expected
+        except Exception as e:
+            congested = is_congestion(e)
+            raise
+        finally:
+            with self.lock:
+                self.active_num -= 1
+            if self.adaptive is not None:
+                self.adaptive.release(host, size, congested)
+
+    async def _fetch_url(self, url: str, path: str) -> tuple:
+        size = 0
+        # 与多线程下载器共用同一个按主机的令牌桶
+        wait = rate_limiter.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = time.time()
+        async with self.client.get(url, headers=self.header) as resp:
+            resp.raise_for_status()
+            mirror_selector.record(url, time.time() - start)
+            metrics.ttfb(url, time.time() - start)
+            # 单块写入很快，直接在事件循环中写文件
+            with open(path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+            expected = resp.content_length if resp.content_length is not None else -1
+        metrics.add(host_of(url), self.keyword, bytes=size, seconds=time.time() - start)
+        return size, expected
@@ -1,43 +1,57 @@
 import json
 import logging
 import os
-import re
 import time
 
 from threading import Thread
+from urllib.parse import urlsplit, parse_qs
 
 from selenium.webdriver import Keys
 from selenium.webdriver.common.by import By
 from selenium import webdriver
 from selenium.webdriver.firefox.service import Service
-
-from MultiPlatVideoCrawler.VideoMultiThreadDownloader import VideoMultiThreadDownloader
-from MultiPlatVideoCrawler.CommentSaver import CommentSaver
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+from MultiPlatVideoCrawler.VideoMultiThreadDownloader import create_downloader, resume_downloads
+from MultiPlatVideoCrawler.CommentReplayer import CommentReplayer, replace_query
+from MultiPlatVideoCrawler.CommentSaver import CommentAggregator
+from MultiPlatVideoCrawler.CrawlCheckpoint import get_checkpoint
+from MultiPlatVideoCrawler.FlowPipeline import FlowPipeline, CapturedFlow
+from MultiPlatVideoCrawler.FlowRecorder import FlowRecorder
+from MultiPlatVideoCrawler.FlowRouter import FlowRouter
+from MultiPlatVideoCrawler.KuaishouClient import KuaishouClient
+from MultiPlatVideoCrawler.SearchScheduler import SearchScheduler, SearchWorker
+from MultiPlatVideoCrawler.VideoCapture import VideoCapture
 from MultiPlatVideoCrawler.conf.config import PROJECT_PATH, Profile_dir, DouYinDataSavePath, KuaiShowDataSavePath, \
-    VIDEO_MAX_NUM
+    VIDEO_MAX_NUM, SEARCH_WORKER_NUM, SEARCH_PROXY_PORT, COMMENT_WAIT_TIMEOUT, PAGE_WAIT_TIMEOUT, COMMENT_REPLAY, \
+    FLOW_RECORD, KUAISHOU_BATCH, DOWNLOAD_BACKLOG_HIGH, DOWNLOAD_BACKLOG_LOW, COMMENT_PENDING_HIGH, COMMENT_PENDING_LOW, \
+    FLOW_BACKLOG_HIGH, FLOW_BACKLOG_LOW, PROXY_INTERCEPT_ONLY_API, INTERCEPT_HOSTS, VIDEO_CAPTURE, VIDEO_STORE
+from MultiPlatVideoCrawler.utils import fastjson
+from MultiPlatVideoCrawler.utils.flowcontrol import FlowControl
 from MultiPlatVideoCrawler.utils.log import log_warn, log_INFO
+from MultiPlatVideoCrawler.utils.metrics import metrics
 
 DataSavePath = 0
 
 
 class AutoSlider:
 
-    def __init__(self, platform: str) -> None:
-        self.kuaishou_downloader = None
-        self.option = None
+    def __init__(self, platform: str, keywords: list = None, save_path: str = None, checkpoint=None,
+                 offline: bool = False) -> None:
+        """
+        @param keywords: 要搜索的关键字，None表示从断点文件和keywords.json读取并创建文件夹
+        @param save_path: 数据保存路径，None表示平台的默认路径
+        @param checkpoint: 搜索断点，None表示使用全局断点
+        @param offline: 离线回放：不直接请求评论分页、不旁路保存视频、不记录流量
+        """
         self.keywords = []
         platform_url = {
             "kuaishou": "https://www.kuaishou.com/",
             "douyin": "https://www.douyin.com/"
         }
         global DataSavePath
-        DataSavePath = KuaiShowDataSavePath if platform == 'kuaishou' else DouYinDataSavePath
-        # 生成判断url中是否包含comment的正则表达式
-        self.comment_url = re.compile("^https://www\.douyin\.com/aweme/v1/web/comment/list/")
-        self.video_list_url = re.compile("^https://www\.douyin\.com/aweme/v1/web/general/search/single/")
-        self.kuaishou_request_url = re.compile("^https://www\.kuaishou\.com/graphql")
-
-        self.douyin_downloader = None
+        DataSavePath = save_path or (KuaiShowDataSavePath if platform == 'kuaishou' else DouYinDataSavePath)
         # 浏览器驱动（火狐）
         self.driver = None
 
@@ -47,17 +61,60 @@ class AutoSlider:
         # 视频平台主页
         self.platform_url = platform_url[platform]
 
-        # 设置浏览器参数
-        self.setBrowserOption()
+        # 需要拦截的接口：主机+路径前缀 -> 处理函数
+        self.router = FlowRouter()
+        self.registerRoutes()
+        self.router.register_metrics()
+        if PROXY_INTERCEPT_ONLY_API:
+            # 不在--allow-hosts中的主机不会被解密，其上的路由收不到流量
+            missing = set(self.router.hosts()) - set(INTERCEPT_HOSTS.get(platform, []))
+            if missing:
+                log_warn(f"路由主机{missing}不在INTERCEPT_HOSTS中，需要加入后重新运行start.py")
+
+        # 搜索断点：关键字和评论游标
+        self.checkpoint = checkpoint or get_checkpoint()
 
         # 导入关键字
-        self.addKeyWords()
+        if keywords is None:
+            self.addKeyWords()
+        else:
+            self.keywords = list(keywords)
 
         # 保存状态->是否开始搜索->决定是否调用search方法 search方法只会调用一次
         self.isStart = False
 
-        # 当前搜索的关键字id
-        self.now_search = None
+        # 多个浏览器并行搜索，各自记录当前关键字
+        self.scheduler = SearchScheduler(self.keywords, SEARCH_WORKER_NUM, SEARCH_PROXY_PORT, platform)
+
+        # 按视频合并分页评论，批量写文件
+        self.comments = CommentAggregator()
+
+        # 后台处理拦截到的流量，代理钩子不做解析和文件读写
+        self.pipeline = FlowPipeline(self.handleFlow)
+
+        # 直接请求后续评论分页，快手合并成批量GraphQL请求，并直接请求搜索结果中视频的评论
+        replay = COMMENT_REPLAY and not offline
+        self.client = KuaishouClient(self.pipeline) if replay and KUAISHOU_BATCH and platform == "kuaishou" else None
+        self.replayer = self.client or (CommentReplayer(self.pipeline) if replay else None)
+
+        # 下载、评论写入或流量解析跟不上时暂停浏览器翻页
+        self.flow_control = FlowControl()
+        self.flow_control.add("downloads", metrics.download_backlog, DOWNLOAD_BACKLOG_HIGH, DOWNLOAD_BACKLOG_LOW)
+        self.flow_control.add("comments", lambda: self.comments.pending_num, COMMENT_PENDING_HIGH, COMMENT_PENDING_LOW,
+                              self.comments.flush)
+        self.flow_control.add("flows", self.pipeline.flows.qsize, FLOW_BACKLOG_HIGH, FLOW_BACKLOG_LOW)
+        metrics.register_gauge("flow_control", self.flow_control.stats)
+
+        # 浏览器播放的视频直接从代理写入视频库，关键字结束时只下载没播放过的
+        self.capture = None
+        if VIDEO_CAPTURE and not offline:
+            if VIDEO_STORE:
+                self.capture = VideoCapture(platform)
+            else:
+                log_warn("视频旁路保存需要启用VIDEO_STORE")
+
+        # 记录拦截到的接口流量，用于离线回放
+        self.recorder = FlowRecorder() if FLOW_RECORD and not offline else None
 
     def addKeyWords(self):
         """"为搜索添加关键字，并为其创建文件夹"""
@@ -66,6 +123,8 @@ class AutoSlider:
             last = json.load(f)
             last = last['Lastkeyword']
 
+        # 已搜完的关键字（多个浏览器并行时，断点之后也可能有已搜完的关键字）
+        finished = self.checkpoint.finished_keywords(self.platform)
         with open(f"{PROJECT_PATH}\keywords\keywords.json", "r", encoding="utf-8") as f:
             flag = False
             for i in json.load(f):
@@ -73,7 +132,7 @@ class AutoSlider:
                     flag = True
                 if flag == False and i["keyword_order"] == int(last):
                     flag = True
-                if not flag:
+                if not flag or str(i["keyword_order"]) in finished:
                     continue
                 # 添加关键字
                 self.keywords.append(i)
@@ -84,8 +143,11 @@ class AutoSlider:
                 # 视频
                 self.mkdir(f"{DataSavePath}\\{i['keyword_order']}\\video")
 
-    def setBrowserOption(self) -> None:
-        """设置浏览器参数"""
+    def getBrowserOption(self, port: int = None):
+        """
+        浏览器参数，每次调用生成独立的用户文件副本（selenium会把用户文件复制到临时目录）
+        @param port: 代理端口，None表示使用用户文件中的代理设置
+        """
         # 添加保持登录的数据路径：安装目录一般在C:\Users\user\AppData\Local\Google\Firefox\User Data
         profile = webdriver.FirefoxProfile(Profile_dir)
         # 驱动选项
@@ -93,9 +155,13 @@ class AutoSlider:
         # 解除自动化控制标记
         option.add_argument("--disable-blink-features=AutomationControlled")
         option.profile = profile
-
-        # 初始化driver
-        self.option = option
+        if port is not None:
+            # 每个浏览器连接mitmdump的不同端口，代理据此区分流量属于哪个浏览器
+            option.set_preference("network.proxy.type", 1)
+            for scheme in ("http", "ssl"):
+                option.set_preference(f"network.proxy.{scheme}", "127.0.0.1")
+                option.set_preference(f"network.proxy.{scheme}_port", port)
+        return option
 
     @staticmethod
     def get_html_elements(driver, xpath: str) -> list:
@@ -112,6 +178,12 @@ class AutoSlider:
             elements = []
         return elements
 
+    @staticmethod
+    def waitClickable(driver, css_selector: str):
+        """等待元素可以点击，超时抛出TimeoutException"""
+        return WebDriverWait(driver, PAGE_WAIT_TIMEOUT).until(
+            expected_conditions.element_to_be_clickable((By.CSS_SELECTOR, css_selector)))
+
     @staticmethod
     def doFuncUntilNoException(func, args: tuple) -> any:
         """执行函数，如果报错，等待一段时间后继续执行直到正常执行"""
@@ -126,44 +198,87 @@ class AutoSlider:
             else:
                 return result
 
-    def setNowSearch(self, keyID) -> any:
-        """设置当前搜索的关键字"""
-        self.now_search = keyID['keyword_order']
-        with open(f"{PROJECT_PATH}\keywords\LastKeyIN{self.platform}.json", "w", encoding="utf-8") as f:
-            json.dump({
-                "Lastkeyword": self.now_search
-            }, f)
+    def setNowSearch(self, worker: SearchWorker, keyID, downloader) -> any:
+        """设置浏览器当前搜索的关键字及其下载器，断点记录为最早的未搜完的关键字"""
+        worker.switch(keyID['keyword_order'], downloader)
+        self.scheduler.save_resume_point(f"{PROJECT_PATH}\keywords\LastKeyIN{self.platform}.json")
+
+    def finishKeyword(self, worker: SearchWorker, wait: bool = False) -> None:
+        """
+        浏览器搜完一个关键字：处理完已拦截的流量，写出评论，下载器排空队列后退出
+        @param wait: 是否等待视频下载完成
+        """
+        if worker.keyword is None:
+            return
+        self.drainFlows(worker.keyword)
+        self.comments.finalize(f"{DataSavePath}\\{worker.keyword}\\comments")
+        if self.capture is not None:
+            self.capture.finish_keyword(worker.keyword, worker.downloader)
+        worker.downloader.shutdown(wait=wait)
+        self.scheduler.keyword_done(worker.keyword)
+        self.checkpoint.finish_keyword(self.platform, worker.keyword)
+        if self.replayer is not None:
+            self.replayer.forget(worker.keyword)
+
+    def drainFlows(self, keyword=None) -> None:
+        """
+        等待已拦截的流量和直接请求的评论分页处理完
+        @param keyword: 只等待该关键字的，其他浏览器的关键字继续运行；None表示全部
+        """
+        while True:
+            self.pipeline.join(keyword)
+            # 处理分页时可能又提交了下一页的请求
+            if self.replayer is None or not self.replayer.join(keyword):
+                return
+
+    def startKeyword(self, worker: SearchWorker, keyword) -> None:
+        """浏览器开始搜索新的关键字：先创建下载器，再同时切换关键字和下载器，新关键字的流量不会交给旧下载器"""
+        keyword_id = keyword['keyword_order']
+        downloader = create_downloader(
+            f"{DataSavePath}\\{keyword_id}\\video",
+            self.platform, 10, keyword=keyword_id)
+        self.checkpoint.start_keyword(self.platform, keyword_id)
+        self.setNowSearch(worker, keyword, downloader)
 
     def searchInDouYin(self) -> None:
         """
-        在平台中搜索
+        在平台中搜索，多个浏览器并行，各自领取关键字
         """
+        # 继续上次运行中未完成的下载
+        resume_downloads(self.platform)
+        self.scheduler.run(self.searchInDouYinWorker)
+
+    def searchInDouYinWorker(self, worker: SearchWorker) -> None:
+        """单个浏览器的抖音搜索循环"""
         # 打开浏览器
-        driver = webdriver.Firefox(options=self.option)
+        driver = webdriver.Firefox(options=self.getBrowserOption(worker.port))
         # 最大化
         driver.maximize_window()
         time.sleep(5)
-        for keyword in self.keywords:
-            # 设置当前搜索
-            self.setNowSearch(keyword)
-            # 初始化抖音下载器
-            self.douyin_downloader = VideoMultiThreadDownloader(
-                f"{DataSavePath}\\{self.now_search}\\video",
-                "douyin", 10)
+        while True:
+            keyword = self.scheduler.next_keyword()
+            if keyword is None:
+                break
+            # 上一个关键字收尾，再切换到新关键字
+            self.finishKeyword(worker)
+            self.startKeyword(worker, keyword)
 
             # 请求
             driver.get(f"https://www.douyin.com/search/{keyword['keyword']}")
             video_order = 0
 
             def findScrollList():
-                li = self.doFuncUntilNoException(driver.find_elements, (By.XPATH, "//ul[@data-e2e='scroll-list']/li"))
-                time.sleep(2)
+                # 等搜索结果列表出现，超时后由doFuncUntilNoException重试
+                li = WebDriverWait(driver, PAGE_WAIT_TIMEOUT).until(
+                    expected_conditions.presence_of_all_elements_located((By.XPATH, "//ul[@data-e2e='scroll-list']/li")))
                 return li[0].get_attribute('class')
 
             className = self.doFuncUntilNoException(findScrollList, ())
 
             log_warn(className)
             for i in range(VIDEO_MAX_NUM):
+                # 积压过多时等下载和评论写入跟上再翻页
+                self.flow_control.wait(worker.name)
                 scroll2view = """
                     let element = document.getElementsByClassName(\"""" + className + "\")[" + str(i) + "];" + \
                               """                 
@@ -174,6 +289,7 @@ class AutoSlider:
                                  });
                               """
                 driver.execute_script(scroll2view)
+                seen = worker.comment_pages
                 try:
                     commentList = self.get_html_elements(driver, "//div[@data-e2e='feed-comment-icon']")
                     commentList[i if i < len(commentList) else -3].click()
@@ -183,45 +299,66 @@ class AutoSlider:
                 except Exception as e:
                     print(e)
                     print("I' m here!")
-                time.sleep(5)
+                else:
+                    # 代理收到这个视频的评论后立即翻到下一个，最多等待COMMENT_WAIT_TIMEOUT秒
+                    if not worker.wait_comment(seen, COMMENT_WAIT_TIMEOUT):
+                        log_warn(f"{worker.name}等待评论超时")
+                # 不超过配置的最快节奏
+                worker.pacer.acquire()
                 video_order += 1
         driver.quit()
+        # 等待最后一个关键字的视频下载完成
+        self.finishKeyword(worker, wait=True)
 
     def searchInKuaiShou(self):
-
+        """在平台中搜索，多个浏览器并行，各自领取关键字"""
+        # 继续上次运行中未完成的下载
+        resume_downloads(self.platform)
         time.sleep(5)
+        self.scheduler.run(self.searchInKuaiShouWorker)
+
+    def searchInKuaiShouWorker(self, worker: SearchWorker) -> None:
+        """单个浏览器的快手搜索循环"""
         # 打开浏览器
         gecko_driver_path = 'D:\Python\python3.11.4\geckodriver.exe'
         # 固定搭配直接用就行了
         service = Service(executable_path=gecko_driver_path)
-        driver = webdriver.Firefox(options=self.option)
+        driver = webdriver.Firefox(options=self.getBrowserOption(worker.port))
         # 最大化
         driver.maximize_window()
-        for keyword in self.keywords:
-            # 设置当前搜索
-            self.setNowSearch(keyword)
-
-            # 初始化快手下载器
-            self.kuaishou_downloader = VideoMultiThreadDownloader(
-                f"{DataSavePath}\\{self.now_search}\\video",
-                "kuaishou", 10)
+        while True:
+            keyword = self.scheduler.next_keyword()
+            if keyword is None:
+                break
+            # 上一个关键字收尾，再切换到新关键字
+            self.finishKeyword(worker)
+            self.startKeyword(worker, keyword)
 
             # 请求
             driver.get(f"https://www.kuaishou.com/search/video?searchKey={keyword['keyword']}")
-            time.sleep(5)
-            card = self.doFuncUntilNoException(driver.find_element,
-                                               (By.CSS_SELECTOR,
-                                                "div.video-card:nth-child(1)>div:nth-child(1)>div:nth-child(1)"))
+            # 等第一张卡片可以点击
+            card = self.doFuncUntilNoException(self.waitClickable, (
+                driver, "div.video-card:nth-child(1)>div:nth-child(1)>div:nth-child(1)"))
             # 点击第一张卡片
+            seen = worker.comment_pages
             self.doFuncUntilNoException(card.click, ())
-            time.sleep(2)
-            next_t = self.doFuncUntilNoException(driver.find_element,
-                                                 (By.CSS_SELECTOR, "div.video-switch-next"))
+            next_t = self.doFuncUntilNoException(self.waitClickable, (driver, "div.video-switch-next"))
             for i in range(VIDEO_MAX_NUM):
-                time.sleep(5)
+                # 代理收到当前视频的评论后立即翻到下一个，最多等待COMMENT_WAIT_TIMEOUT秒
+                if not worker.wait_comment(seen, COMMENT_WAIT_TIMEOUT):
+                    log_warn(f"{worker.name}等待评论超时")
+                # 搜索结果和其中视频的评论已由批量请求取得，不用再逐个点开
+                if self.client is not None and self.client.search_done(worker.keyword):
+                    break
+                # 不超过配置的最快节奏，积压过多时等下载和评论写入跟上
+                worker.pacer.acquire()
+                self.flow_control.wait(worker.name)
+                seen = worker.comment_pages
                 # 下一个
                 self.doFuncUntilNoException(next_t.click, ())
         driver.quit()
+        # 等待最后一个关键字的视频下载完成
+        self.finishKeyword(worker, wait=True)
 
     @staticmethod
     def mkdir(path):
@@ -231,6 +368,36 @@ class AutoSlider:
             # print(e)
             pass
 
+    def done(self):
+        """mitmproxy退出时写入最终指标并打印摘要"""
+        if self.replayer is not None:
+            self.replayer.shutdown()
+        self.pipeline.shutdown()
+        if self.capture is not None:
+            self.capture.shutdown()
+        self.comments.finalize()
+        if self.recorder is not None:
+            self.recorder.close()
+        metrics.flush()
+        log_INFO(metrics.summary())
+
+    def responseheaders(self, flow):
+        """接口以外的响应（页面、脚本、图片）边收边转发，不在代理中缓存响应体"""
+        if self.capture is not None:
+            # 搜索结果中的视频：转发的同时写入视频库
+            writer = self.capture.open(flow)
+            if writer is not None:
+                flow.response.stream = writer
+                flow.metadata["video_capture"] = writer
+                return
+        if self.router.match(flow.request.host, flow.request.path) is None:
+            flow.response.stream = True
+
+    def error(self, flow):
+        """连接中断（浏览器切到下一个视频时常见），写了一半的视频留给下载器"""
+        if self.capture is not None and "video_capture" in flow.metadata:
+            self.capture.finish(flow.metadata["video_capture"], flow.error)
+
     def response(self, flow):
         if not self.isStart:
             self.isStart = True
@@ -241,78 +408,150 @@ class AutoSlider:
                 Thread(target=self.searchInKuaiShou).start()
         if flow is None:
             return
+        if self.capture is not None and "video_capture" in flow.metadata:
+            # 视频已转发完
+            self.capture.finish(flow.metadata["video_capture"])
+            return
 
-        # 判断是否满足评论url
-        if self.comment_url.match(flow.request.url):
-            log_warn("a comment!")
-
-            # 格式转换
-            json_data = json.loads(flow.response.get_text())
-
-            comment_list = []
-            aweme_id = json_data['comments'][0]['aweme_id']
-
-            # 迭代存储
-            for comment_data in json_data['comments']:
-                comment_list.append({
-                    "text": comment_data['text'],
-                    "digg_count": comment_data['digg_count']
-                })
-            # 保存评论
-            CommentSaver(aweme_id, {
-                "aweme_id": aweme_id,
-                "comment": comment_list,
-                "count": len(comment_list)
-            }, f"{DataSavePath}\\{self.now_search}\\comments").save()
-        elif self.video_list_url.match(flow.request.url):
-            # 格式转换
-            json_data = json.loads(flow.response.get_text())['data']
-            for v in json_data:
-                try:
-                    vid = v['aweme_info']['aweme_id']
-                    url_list = v['aweme_info']['video']['download_addr']['url_list']
-                    for url in url_list:
-                        # log_warn(url)
-                        try:
-                            self.douyin_downloader.download_control("download", (vid, url))
-                        except Exception:
-                            log_warn(f'{url} failed!!')
-                        else:
-                            break
-                except KeyError as e:
-                    print(e)
-                    continue
-        elif self.kuaishou_request_url.match(flow.request.url):
-            queryData = json.loads(flow.request.content)
-            if queryData['operationName'] == "commentListQuery":
-                # 格式转换
-                json_data = json.loads(flow.response.get_text())['data']
-                log_warn("a comment!")
-                comment_list = []
-                aweme_id = queryData['variables']['photoId']
-
-                # 迭代存储
-                for comment_data in json_data['visionCommentList']['rootComments']:
-                    comment_list.append({
-                        "text": comment_data['content'],
-                        "digg_count": comment_data['likedCount']
-                    })
-                # 保存评论
-                CommentSaver(aweme_id, {
-                    "aweme_id": aweme_id,
-                    "comment": comment_list,
-                    "count": len(comment_list)
-                }, f"{DataSavePath}\\{self.now_search}\\comments").save()
-            elif queryData['operationName'] == "visionSearchPhoto":
-                # 格式转换
-                video_list = json.loads(flow.response.get_text())['data']['visionSearchPhoto']['feeds']
-                for v in video_list:
-                    try:
-                        video = v['photo']
-                        self.kuaishou_downloader.download_control("download", (video['id'], video['photoUrl']))
-                    except KeyError as e:
-                        print(e)
-                        continue
+        # 按主机和路径前缀查路由表，不相关的流量直接放行
+        route = self.router.match(flow.request.host, flow.request.path)
+        if route is not None:
+            # 按代理监听端口找到发出请求的浏览器
+            port = flow.client_conn.sockname[1]
+            worker = self.scheduler.worker_for_port(port)
+            if worker is None:
+                return
+            keyword, downloader = worker.current()
+            if keyword is None:
+                return
+            # 只复制数据，记下浏览器当前的关键字和下载器，解析交给后台线程
+            captured = CapturedFlow.from_flow(flow, keyword, downloader, route, worker)
+            self.pipeline.submit(captured)
+
+    def handleFlow(self, captured: CapturedFlow) -> None:
+        """后台线程处理一条流量：浏览器拦截到的先记录（写文件不占用代理的事件循环），再交给路由"""
+        if self.recorder is not None and not captured.replayed:
+            self.recorder.record(captured, captured.worker.port)
+        self.router.dispatch(captured)
+
+    def registerRoutes(self) -> None:
+        """注册当前平台需要处理的接口"""
+        if self.platform == "douyin":
+            self.router.add("www.douyin.com", "/aweme/v1/web/comment/list/", self.handleDouYinComment, "douyin-comment")
+            self.router.add("www.douyin.com", "/aweme/v1/web/general/search/single/", self.handleDouYinSearch,
+                            "douyin-search")
+        else:
+            self.router.add("www.kuaishou.com", "/graphql", self.handleKuaiShouGraphQL, "kuaishou-graphql")
+        # 快手GraphQL按operationName分发
+        self.graphql_handlers = {
+            "commentListQuery": self.handleKuaiShouComment,
+            "visionSearchPhoto": self.handleKuaiShouSearch,
+        }
+
+    def handleDouYinComment(self, captured: CapturedFlow) -> None:
+        """保存抖音评论"""
+        log_warn("a comment!")
+
+        # 只取出评论内容和点赞数
+        aweme_id, comment_list, next_cursor, has_more = fastjson.douyin_comment_page(captured.body())
+        if aweme_id is not None:
+            # 合并到该视频已收到的评论
+            cursor = parse_qs(urlsplit(captured.url).query).get('cursor', [None])[0]
+            added = self.comments.add(aweme_id, comment_list, f"{DataSavePath}\\{captured.keyword}\\comments",
+                                      cursor)
+            # 记录断点并直接请求下一页
+            self.followComments(captured, aweme_id, cursor, next_cursor if has_more else None, added,
+                                lambda c: (replace_query(captured.url, cursor=c), None))
+        # 通知浏览器评论已到达（没有评论的视频也不用再等）
+        if not captured.replayed:
+            captured.worker.comment_received()
+
+    def followComments(self, captured: CapturedFlow, video_id, cursor, next_cursor, added: int,
+                       next_request) -> None:
+        """
+        记录评论断点，并直接请求下一页
+        @param cursor: 这一页的请求游标
+        @param next_cursor: 下一页的游标，None表示评论已取完
+        @param added: 这一页新增的评论数
+        @param next_request: 函数，游标 -> (链接, 请求体)
+        """
+        if not captured.replayed:
+            # 浏览器打开的是第一页，上次运行已取过的视频从断点继续
+            saved_cursor, done = self.checkpoint.comment_cursor(self.platform, captured.keyword, video_id)
+            if done:
+                return
+            if saved_cursor is not None:
+                next_cursor = saved_cursor
+            else:
+                self.saveCommentCursor(captured, video_id, cursor, next_cursor, added)
+        else:
+            self.saveCommentCursor(captured, video_id, cursor, next_cursor, added)
+        if self.replayer is not None and next_cursor is not None:
+            self.replayer.follow(captured, video_id, *next_request(next_cursor))
+
+    def saveCommentCursor(self, captured: CapturedFlow, video_id, cursor, next_cursor, added: int) -> None:
+        """先把这个视频已收到的评论写入文件再记录断点，中断后从断点继续时不会漏掉评论"""
+        self.comments.flush_video(video_id, f"{DataSavePath}\\{captured.keyword}\\comments")
+        self.checkpoint.comment_page(self.platform, captured.keyword, video_id, cursor, next_cursor, added)
+
+    def submitVideo(self, captured: CapturedFlow, vid, urls, play_urls=()) -> None:
+        """
+        提交搜索结果中的视频：旁路保存时先等浏览器播放，关键字结束时再下载没播放过的
+        @param urls: 下载链接或镜像链接列表
+        @param play_urls: 浏览器播放时使用的链接
+        """
+        if self.capture is not None and \
+                self.capture.register(captured.keyword, vid, urls, captured.downloader.save_path, play_urls):
+            return
+        captured.downloader.download_control("download", (vid, urls))
+
+    def handleDouYinSearch(self, captured: CapturedFlow) -> None:
+        """提交抖音搜索结果中的视频下载"""
+        # 所有镜像一起交给下载器，由下载器竞速选择并在中断时切换
+        videos = fastjson.douyin_search_videos(captured.body())
+        self.checkpoint.search_page(self.platform, captured.keyword, len(videos))
+        for vid, url_list, play_list in videos:
+            self.submitVideo(captured, vid, url_list, play_list)
+
+    def handleKuaiShouGraphQL(self, captured: CapturedFlow) -> None:
+        """快手GraphQL请求只解析一次，按operationName交给对应的处理函数"""
+        queryData = fastjson.loads(captured.request_content)
+        handler = self.graphql_handlers.get(queryData.get('operationName'))
+        if handler is not None:
+            handler(captured, queryData)
+
+    def handleKuaiShouComment(self, captured: CapturedFlow, queryData: dict) -> None:
+        """保存快手评论"""
+        log_warn("a comment!")
+        aweme_id = queryData['variables']['photoId']
+        # 只取出评论内容和点赞数
+        comment_list, next_cursor = fastjson.kuaishou_comment_page(captured.body())
+        # 合并到该视频已收到的评论
+        cursor = queryData['variables'].get('pcursor')
+        added = self.comments.add(aweme_id, comment_list, f"{DataSavePath}\\{captured.keyword}\\comments", cursor)
+        # 记录断点并直接请求下一页：同一个查询只替换pcursor
+        self.followComments(captured, aweme_id, cursor, next_cursor, added, lambda c: (captured.url, json.dumps(
+            dict(queryData, variables=dict(queryData['variables'], pcursor=c))).encode()))
+        if not captured.replayed:
+            # 以浏览器的评论查询为模板，直接请求搜索结果中其他视频的评论
+            if self.client is not None:
+                self.client.learn(queryData)
+            # 通知浏览器评论已到达
+            captured.worker.comment_received()
+
+    def handleKuaiShouSearch(self, captured: CapturedFlow, queryData: dict) -> None:
+        """提交快手搜索结果中的视频下载"""
+        videos, next_cursor = fastjson.kuaishou_search_page(captured.body())
+        self.checkpoint.search_page(self.platform, captured.keyword, len(videos))
+        for vid, url in videos:
+            self.submitVideo(captured, vid, url)
+        if self.client is not None:
+            # 不等浏览器点开，批量请求这一页视频的评论（上次运行已取过的从断点继续）和下一页搜索结果
+            for vid, _ in videos:
+                cursor, done = self.checkpoint.comment_cursor(self.platform, captured.keyword, vid)
+                if not done:
+                    self.client.prefetch(captured, vid, cursor or "")
+            self.client.follow_search(captured, queryData, next_cursor, len(videos))
 
 
 if __name__ == "__main__":
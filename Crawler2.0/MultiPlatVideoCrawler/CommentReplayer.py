@@ -0,0 +1,168 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, unquote_plus, quote_plus, urlencode, urlunsplit
+
+from MultiPlatVideoCrawler.conf.config import COMMENT_REPLAY_CONCURRENCY, COMMENT_REPLAY_MAX_PAGES, DOWNLOAD_TIMEOUT
+from MultiPlatVideoCrawler.utils.http import get_session
+from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.metrics import metrics
+
+# 不能原样复用的请求头，由requests重新生成
+_SKIP_HEADERS = {"host", "content-length", "connection", "accept-encoding", "transfer-encoding"}
+
+
+def replace_query(url: str, **params) -> str:
+    """
+    替换链接中的查询参数：只改写对应的key=value片段，其余片段逐字节保留（签名参数重新编码后会失效），
+    链接中没有的参数追加到末尾
+    """
+    parts = urlsplit(url)
+    segments = parts.query.split("&") if parts.query else []
+    for i, segment in enumerate(segments):
+        name = segment.split("=", 1)[0]
+        key = unquote_plus(name)
+        if key in params:
+            segments[i] = f"{name}={quote_plus(str(params.pop(key)))}"
+    if params:
+        segments.append(urlencode({k: str(v) for k, v in params.items()}))
+    return urlunsplit(parts._replace(query="&".join(segments)))
+
+
+class CommentReplayer:
+    """
+    评论分页直接请求：浏览器发出第一页（带签名、cookie）后，复用其请求头，只替换分页游标，
+    通过共享连接池直接请求后续分页，结果放回流量处理队列，与浏览器拦截到的分页一样处理。
+    每个视频的分页按游标顺序请求，不同视频之间并行
+    """
+
+    def __init__(self, pipeline, concurrency=COMMENT_REPLAY_CONCURRENCY, max_pages=COMMENT_REPLAY_MAX_PAGES):
+        """
+        @param pipeline: 流量处理队列（FlowPipeline）
+        @param max_pages: 每个视频最多直接请求的分页数
+        """
+        self.pipeline = pipeline
+        self.max_pages = max_pages
+        self.session = get_session()
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="comment-replay")
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # (关键字, 路由名称, 视频id) -> 已直接请求的分页数
+        self.videos = {}
+        # 关键字 -> 未完成的请求数
+        self.pending = {}
+        self.pending_num = 0
+        # 已结束的关键字：不再请求，已在请求中的结果丢弃
+        self.finished = set()
+        self.pages_num = 0
+        self.failed_num = 0
+        metrics.register_gauge("comment_replay", self.stats)
+
+    def follow(self, captured, video_id, url: str, request_content: bytes = None) -> bool:
+        """
+        请求视频的下一页评论
+        @param captured: 刚处理完的这一页
+        @param url: 下一页的链接
+        @param request_content: 下一页的请求体（POST）
+        @return: 是否提交了请求（视频已由其他分页链接管、或达到分页上限时返回False）
+        """
+        # 浏览器拦截到的分页只在第一次见到该视频时开始直接请求
+        if not self._admit(captured, video_id, not captured.replayed):
+            return False
+        self._request(captured, url, request_content)
+        return True
+
+    def _admit(self, captured, video_id, first: bool) -> bool:
+        """
+        检查视频的分页数并计入未完成的请求
+        @param first: 是否是该视频的第一个请求（视频已有请求时不再开始）
+        """
+        # 同一视频出现在多个关键字的搜索结果中时，每个关键字各自请求并保存
+        key = (captured.keyword, captured.route.name, str(video_id))
+        with self.lock:
+            if captured.keyword in self.finished:
+                return False
+            pages = self.videos.get(key)
+            if first:
+                if pages is not None:
+                    return False
+                pages = 0
+            if pages is None or pages >= self.max_pages:
+                return False
+            self.videos[key] = pages + 1
+            self.pending[captured.keyword] = self.pending.get(captured.keyword, 0) + 1
+            self.pending_num += 1
+        return True
+
+    def _request(self, captured, url: str, request_content: bytes) -> None:
+        """发出已计入的请求"""
+        self.executor.submit(self._fetch, captured, url, request_content)
+
+    @staticmethod
+    def _headers(captured) -> dict:
+        return {k: v for k, v in captured.request_headers.items() if k.lower() not in _SKIP_HEADERS}
+
+    def is_finished(self, captured) -> bool:
+        with self.lock:
+            return captured.keyword in self.finished
+
+    def _submit(self, captured, url: str, request_content: bytes, content: bytes) -> None:
+        """响应放入流量处理队列，关键字已结束时丢弃"""
+        if self.is_finished(captured):
+            return
+        self.pipeline.submit(captured.follow_up(url, request_content or b"", content), block=True)
+        with self.lock:
+            self.pages_num += 1
+
+    def _fetch(self, captured, url: str, request_content: bytes) -> None:
+        try:
+            if self.is_finished(captured):
+                return
+            resp = self.session.request(captured.method, url, data=request_content, headers=self._headers(captured),
+                                        timeout=DOWNLOAD_TIMEOUT)
+            resp.raise_for_status()
+            self._submit(captured, url, request_content, resp.content)
+        except Exception as e:
+            # 签名失效或被限流时停止这个视频的直接请求，不影响浏览器
+            log_warn(f"直接请求评论分页失败: {e!r}")
+            with self.lock:
+                self.failed_num += 1
+        finally:
+            self._finish(captured)
+
+    def _finish(self, captured) -> None:
+        """一个请求结束"""
+        with self.lock:
+            self.pending[captured.keyword] -= 1
+            if not self.pending[captured.keyword]:
+                del self.pending[captured.keyword]
+            self.pending_num -= 1
+            self.idle.notify_all()
+
+    def forget(self, keyword) -> None:
+        """关键字结束后释放其视频的分页计数，之后该关键字的请求和结果都丢弃"""
+        with self.lock:
+            self.finished.add(keyword)
+            for key in [k for k in self.videos if k[0] == keyword]:
+                del self.videos[key]
+
+    def join(self, keyword=None, timeout: float = None) -> bool:
+        """
+        等待已提交的请求完成
+        @param keyword: 只等待该关键字的请求，None表示全部
+        @return: 调用时是否有未完成的请求
+        """
+        def idle():
+            return self.pending_num == 0 if keyword is None else keyword not in self.pending
+
+        with self.idle:
+            busy = not idle()
+            self.idle.wait_for(idle, timeout)
+            return busy
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"videos": len(self.videos), "pending": self.pending_num, "pages": self.pages_num,
+                    "failed": self.failed_num}
@@ -1,5 +1,9 @@
 import json
+import os
+import threading
+import time
 
+from MultiPlatVideoCrawler.conf.config import COMMENT_FLUSH_SIZE, COMMENT_FLUSH_INTERVAL
 from MultiPlatVideoCrawler.utils.log import log_warn
 
 
@@ -11,8 +15,184 @@ class CommentSaver:
         self.save_path = save_path
 
     def save(self):
-        with open(f"{self.save_path}\\{self.video_id}.json", "w+", encoding="utf-8") as f:
+        # 先写临时文件再替换，合并已有评论时中断不会损坏原文件
+        path = f"{self.save_path}\\{self.video_id}.json"
+        with open(f"{path}.tmp", "w+", encoding="utf-8") as f:
             # json.loads(str(self))
             json.dump(self.comments, f, indent=4, skipkeys=True, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
 
         log_warn(f"保存评论{self.video_id}.json成功")
+
+
+class VideoComments:
+    """单个视频的评论合并状态（由CommentAggregator的锁保护）"""
+
+    def __init__(self, video_id, save_path):
+        self.video_id = video_id
+        self.save_path = save_path
+        # 已收到的评论id和分页游标
+        self.comment_ids = set()
+        self.cursors = set()
+        # 尚未写入文件的评论
+        self.pending = []
+        self.count = 0
+        self.flushed = time.time()
+
+    @property
+    def jsonl_path(self) -> str:
+        return os.path.join(self.save_path, f"{self.video_id}.jsonl")
+
+    @property
+    def json_path(self) -> str:
+        """CommentSaver写出的评论文件"""
+        return f"{self.save_path}\\{self.video_id}.json"
+
+    def saved_comments(self) -> list:
+        """已写出的{视频id}.json中的评论，没有或无法读取时返回空列表"""
+        try:
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("comment") or []
+        except (OSError, ValueError, AttributeError):
+            return []
+
+
+class CommentAggregator:
+    """
+    按视频合并分页的评论：同一游标的分页只处理一次，评论按id去重，
+    新评论攒够一批后追加到{视频id}.jsonl，视频结束时合并到{视频id}.json（每条评论带cid）并删除jsonl
+    """
+
+    def __init__(self, flush_size=COMMENT_FLUSH_SIZE, flush_interval=COMMENT_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        # (保存路径, 视频id) -> VideoComments
+        self.videos = {}
+        # 上次检查所有视频超时未写入的评论的时间
+        self.swept = time.time()
+
+    @property
+    def pending_num(self) -> int:
+        """尚未写入文件的评论数"""
+        with self.lock:
+            return sum(len(v.pending) for v in self.videos.values())
+
+    def add(self, video_id, comments: list, save_path: str, cursor=None) -> int:
+        """
+        合并一页评论
+        @param comments: [(评论id, 评论)]，评论id为None时不去重
+        @param cursor: 这一页的分页游标，None表示未知
+        @return: 新增的评论数
+        """
+        video_id = str(video_id)
+        with self.lock:
+            video = self.videos.get((save_path, video_id))
+            if video is None:
+                video = self.videos[(save_path, video_id)] = self._load(video_id, save_path)
+            if cursor is not None:
+                if str(cursor) in video.cursors:
+                    return 0
+                video.cursors.add(str(cursor))
+            num = 0
+            for comment_id, comment in comments:
+                if comment_id is not None:
+                    if comment_id in video.comment_ids:
+                        continue
+                    video.comment_ids.add(comment_id)
+                video.pending.append(dict(comment, cid=comment_id))
+                num += 1
+            video.count += num
+            now = time.time()
+            if len(video.pending) >= self.flush_size or now - video.flushed >= self.flush_interval:
+                self._flush(video)
+            if now - self.swept >= self.flush_interval:
+                # 不再收到分页的视频也按时写入，待写入的评论数不会一直增长
+                self.swept = now
+                for other in self.videos.values():
+                    if now - other.flushed >= self.flush_interval:
+                        self._flush(other)
+            return num
+
+    @staticmethod
+    def _load(video_id, save_path) -> VideoComments:
+        """
+        已写出的json（关键字结束后又收到分页、或写出后重启）和上次运行中断时留下的jsonl中的评论计入去重
+        """
+        video = VideoComments(video_id, save_path)
+        for comment in video.saved_comments():
+            if comment.get("cid") is not None:
+                video.comment_ids.add(comment["cid"])
+            video.count += 1
+        if os.path.exists(video.jsonl_path):
+            with open(video.jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        comment_id = json.loads(line).get("cid")
+                    except ValueError:
+                        # 中断时写了一半的行
+                        continue
+                    if comment_id is not None:
+                        video.comment_ids.add(comment_id)
+                    video.count += 1
+        return video
+
+    def _flush(self, video: VideoComments) -> None:
+        """把视频待写入的评论追加到jsonl（需持有锁）"""
+        video.flushed = time.time()
+        if not video.pending:
+            return
+        with open(video.jsonl_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(c, ensure_ascii=False) + "\n" for c in video.pending))
+        video.pending = []
+
+    def flush_video(self, video_id, save_path: str) -> None:
+        """视频待写入的评论追加到文件（记录评论断点前调用，断点不会超前于已写入的评论）"""
+        with self.lock:
+            video = self.videos.get((save_path, str(video_id)))
+            if video is not None:
+                self._flush(video)
+
+    def flush(self) -> None:
+        """所有视频待写入的评论追加到文件"""
+        with self.lock:
+            for video in self.videos.values():
+                self._flush(video)
+
+    def finalize(self, save_path: str = None) -> int:
+        """
+        把jsonl中的评论合并到视频的{视频id}.json（格式与CommentSaver相同），删除jsonl并释放内存
+        @param save_path: 只处理该目录下的视频，None表示全部
+        @return: 处理的视频数
+        """
+        with self.lock:
+            videos = [v for k, v in self.videos.items() if save_path is None or k[0] == save_path]
+            for video in videos:
+                self._flush(video)
+                del self.videos[(video.save_path, video.video_id)]
+        for video in videos:
+            if not os.path.exists(video.jsonl_path):
+                # 只收到过空的分页
+                continue
+            # 已写出的评论保留，jsonl中已合并过的评论（写出json后、删除jsonl前中断）跳过
+            comment_list = video.saved_comments()
+            saved_ids = {c["cid"] for c in comment_list if c.get("cid") is not None}
+            with open(video.jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        comment = json.loads(line)
+                    except ValueError:
+                        continue
+                    if comment.get("cid") is None:
+                        comment.pop("cid", None)
+                    elif comment["cid"] in saved_ids:
+                        continue
+                    comment_list.append(comment)
+            CommentSaver(video.video_id, {
+                "aweme_id": video.video_id,
+                "comment": comment_list,
+                "count": len(comment_list)
+            }, video.save_path).save()
+            # comments目录下只留json，后续的清洗脚本按json读取
+            os.remove(video.jsonl_path)
+        return len(videos)
@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from MultiPlatVideoCrawler.conf.config import MANIFEST_PATH
+
+# 关键字状态
+SEARCHING = "searching"
+FINISHED = "finished"
+
+
+class CrawlCheckpoint:
+    """
+    搜索断点（与下载清单同一个SQLite文件）：记录每个关键字的搜索进度和每个视频的评论游标，
+    重启时跳过已搜完的关键字和已取完的评论，也可以直接查询进度而不用扫描输出目录
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS keywords (
+                    platform TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    search_pages INTEGER NOT NULL DEFAULT 0,
+                    videos_seen INTEGER NOT NULL DEFAULT 0,
+                    started REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (platform, keyword)
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS comment_cursors (
+                    platform TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    vid TEXT NOT NULL,
+                    cursor TEXT,
+                    pages INTEGER NOT NULL DEFAULT 0,
+                    comments INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (platform, keyword, vid)
+                )""")
+
+    def start_keyword(self, platform: str, keyword) -> None:
+        """关键字开始搜索（已搜完的关键字重新搜索时状态改回搜索中）"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO keywords (platform, keyword, state, started, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (platform, keyword) DO UPDATE SET state = excluded.state, updated = excluded.updated",
+                (platform, str(keyword), SEARCHING, now, now))
+
+    def finish_keyword(self, platform: str, keyword) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE keywords SET state = ?, updated = ? WHERE platform = ? AND keyword = ?",
+                              (FINISHED, time.time(), platform, str(keyword)))
+
+    def finished_keywords(self, platform: str) -> set:
+        """已搜完的关键字id"""
+        with self.lock:
+            rows = self.conn.execute("SELECT keyword FROM keywords WHERE platform = ? AND state = ?",
+                                     (platform, FINISHED)).fetchall()
+        return {row[0] for row in rows}
+
+    def search_page(self, platform: str, keyword, videos: int) -> None:
+        """记录收到的一页搜索结果"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE keywords SET search_pages = search_pages + 1, videos_seen = videos_seen + ?, updated = ? "
+                "WHERE platform = ? AND keyword = ?",
+                (videos, time.time(), platform, str(keyword)))
+
+    def comment_page(self, platform: str, keyword, vid, cursor, next_cursor, comments: int) -> None:
+        """
+        记录收到的一页评论：只有请求游标等于断点的那一页才把断点推进到下一页，
+        乱序或重复到达的分页不会让断点倒退，已取完的视频不会再变回未取完
+        @param cursor: 这一页的请求游标
+        @param next_cursor: 下一页的游标，None表示评论已取完
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO comment_cursors (platform, keyword, vid, cursor, pages, comments, done, updated) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (platform, keyword, vid) DO UPDATE SET "
+                "cursor = CASE WHEN done = 0 AND cursor IS ? THEN excluded.cursor ELSE cursor END, "
+                "pages = pages + 1, comments = comments + excluded.comments, done = MAX(done, excluded.done), "
+                "updated = excluded.updated",
+                (platform, str(keyword), str(vid), None if next_cursor is None else str(next_cursor), comments,
+                 int(next_cursor is None), time.time(), None if cursor is None else str(cursor)))
+
+    def comment_cursor(self, platform: str, keyword, vid) -> tuple:
+        """
+        视频评论的断点
+        @return: (下一页游标, 是否已取完)，没有记录时返回(None, False)
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT cursor, done FROM comment_cursors WHERE platform = ? AND keyword = ? AND vid = ?",
+                (platform, str(keyword), str(vid))).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    def progress(self, platform: str) -> dict:
+        """
+        按关键字汇总进度
+        @return: {关键字: {"state", "search_pages", "videos_seen", "comment_videos", "comment_pages", "comments",
+                 "downloads": {下载状态: 视频数}}}
+        """
+        with self.lock:
+            keywords = self.conn.execute(
+                "SELECT keyword, state, search_pages, videos_seen FROM keywords WHERE platform = ?",
+                (platform,)).fetchall()
+            comments = self.conn.execute(
+                "SELECT keyword, COUNT(*), SUM(pages), SUM(comments) FROM comment_cursors WHERE platform = ? "
+                "GROUP BY keyword", (platform,)).fetchall()
+            try:
+                downloads = self.conn.execute(
+                    "SELECT keyword, state, COUNT(*) FROM videos WHERE platform = ? GROUP BY keyword, state",
+                    (platform,)).fetchall()
+            except sqlite3.OperationalError:
+                # 没有启用下载清单
+                downloads = []
+        result = {}
+
+        def item(keyword) -> dict:
+            if keyword not in result:
+                result[keyword] = {"state": None, "search_pages": 0, "videos_seen": 0, "comment_videos": 0,
+                                   "comment_pages": 0, "comments": 0, "downloads": {}}
+            return result[keyword]
+
+        for keyword, state, search_pages, videos_seen in keywords:
+            item(keyword).update(state=state, search_pages=search_pages, videos_seen=videos_seen)
+        for keyword, videos, pages, num in comments:
+            item(keyword).update(comment_videos=videos, comment_pages=pages, comments=num)
+        for keyword, state, num in downloads:
+            item(keyword)["downloads"][state] = num
+        return result
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_checkpoint = None
+_checkpoint_lock = threading.Lock()
+
+
+def get_checkpoint() -> CrawlCheckpoint:
+    """获取全局搜索断点"""
+    global _checkpoint
+    if _checkpoint is None:
+        with _checkpoint_lock:
+            if _checkpoint is None:
+                _checkpoint = CrawlCheckpoint()
+    return _checkpoint
+
+
+if __name__ == "__main__":
+    # 查看进度：python -m MultiPlatVideoCrawler.CrawlCheckpoint douyin
+    print(json.dumps(get_checkpoint().progress(sys.argv[1] if len(sys.argv) > 1 else "douyin"), indent=4,
+                     ensure_ascii=False))
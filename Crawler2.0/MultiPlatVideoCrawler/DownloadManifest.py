@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from MultiPlatVideoCrawler.conf.config import MANIFEST_PATH, DOWNLOAD_MAX_ATTEMPTS
+
+# 视频下载状态
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+
+
+class DownloadManifest:
+    """
+    下载清单（SQLite，WAL模式）：记录每个发现的视频及其下载状态，
+    进程崩溃后重启只需要继续未完成的视频
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 所有线程共用一个连接，由锁串行化
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    platform TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    vid TEXT NOT NULL,
+                    urls TEXT NOT NULL,
+                    save_path TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (platform, keyword, vid)
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS videos_state ON videos (platform, state)")
+            # 上次运行中断时正在下载的视频重新排队
+            self.conn.execute("UPDATE videos SET state = ? WHERE state = ?", (QUEUED, DOWNLOADING))
+
+    def state(self, platform: str, keyword, vid: str):
+        """视频当前状态，未登记返回None"""
+        with self.lock:
+            row = self.conn.execute("SELECT state FROM videos WHERE platform = ? AND keyword = ? AND vid = ?",
+                                    (platform, str(keyword), vid)).fetchone()
+        return row[0] if row else None
+
+    def add(self, platform: str, keyword, vid: str, urls, save_path: str) -> bool:
+        """
+        登记发现的视频，已登记过的视频更新为最新的链接（旧链接可能已过期）
+        @return: 是否新视频
+        """
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO videos (platform, keyword, vid, urls, save_path, state, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (platform, str(keyword), vid, json.dumps(urls), save_path, QUEUED, now, now))
+            if cursor.rowcount == 1:
+                return True
+            self.conn.execute("UPDATE videos SET urls = ?, updated = ? WHERE platform = ? AND keyword = ? AND vid = ?",
+                              (json.dumps(urls), now, platform, str(keyword), vid))
+            return False
+
+    def claim(self, platform: str, keyword, vid: str) -> bool:
+        """
+        把视频标记为下载中并把尝试次数加1
+        @return: 视频已完成或正被其他下载器下载时返回False
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE videos SET state = ?, attempts = attempts + 1, updated = ? "
+                "WHERE platform = ? AND keyword = ? AND vid = ? AND state IN (?, ?)",
+                (DOWNLOADING, time.time(), platform, str(keyword), vid, QUEUED, FAILED))
+            return cursor.rowcount == 1
+
+    def mark(self, platform: str, keyword, vid: str, state: str, size: int = None, error: str = None) -> None:
+        """更新视频状态"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE videos SET state = ?, bytes = COALESCE(?, bytes), error = ?, updated = ? "
+                "WHERE platform = ? AND keyword = ? AND vid = ?",
+                (state, size, error, time.time(), platform, str(keyword), vid))
+
+    def count(self, platform: str, keyword) -> int:
+        """关键字已登记的视频数"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM videos WHERE platform = ? AND keyword = ?",
+                                     (platform, str(keyword))).fetchone()[0]
+
+    def unfinished(self, platform: str, keyword=None) -> list:
+        """
+        未完成的视频：排队中的，以及失败但尝试次数未达上限的
+        @return: [(关键字, 视频id, 链接, 保存路径)]
+        """
+        sql = "SELECT keyword, vid, urls, save_path FROM videos WHERE platform = ? " \
+              "AND (state = ? OR (state = ? AND attempts < ?))"
+        args = [platform, QUEUED, FAILED, DOWNLOAD_MAX_ATTEMPTS]
+        if keyword is not None:
+            sql += " AND keyword = ?"
+            args.append(str(keyword))
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY created", args).fetchall()
+        return [(k, vid, json.loads(urls), save_path) for k, vid, urls, save_path in rows]
+
+    def stats(self, platform: str = None) -> dict:
+        """
+        按平台、关键字和状态汇总
+        @return: {平台: {关键字: {状态: {"videos": 视频数, "bytes": 字节数, "attempts": 尝试次数}}}}
+        """
+        sql = "SELECT platform, keyword, state, COUNT(*), SUM(bytes), SUM(attempts) FROM videos"
+        args = []
+        if platform is not None:
+            sql += " WHERE platform = ?"
+            args.append(platform)
+        with self.lock:
+            rows = self.conn.execute(sql + " GROUP BY platform, keyword, state", args).fetchall()
+        result = {}
+        for p, keyword, state, videos, size, attempts in rows:
+            result.setdefault(p, {}).setdefault(keyword, {})[state] = {
+                "videos": videos, "bytes": size, "attempts": attempts}
+        return result
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> DownloadManifest:
+    """获取全局下载清单"""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = DownloadManifest()
+    return _manifest
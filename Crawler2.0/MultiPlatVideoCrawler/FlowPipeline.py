@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+
+from MultiPlatVideoCrawler.conf.config import FLOW_WORKER_NUM, FLOW_QUEUE_SIZE
+from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.metrics import metrics
+
+# 工作线程退出标记
+_STOP = object()
+
+
+class CapturedFlow:
+    """
+    代理钩子中复制出的流量数据，不持有mitmproxy的flow对象
+    """
+
+    def __init__(self, url: str, request_content: bytes, response_content: bytes, content_encoding: str = None,
+                 keyword=None, downloader=None, route=None, worker=None):
+        self.url = url
+        self.request_content = request_content
+        # 未解压的响应体及其压缩方式，解压放到后台线程
+        self.response_content = response_content
+        self.content_encoding = content_encoding
+        # 捕获时的关键字和下载器（后台处理时当前关键字可能已经切换）
+        self.keyword = keyword
+        self.downloader = downloader
+        # 匹配到的路由
+        self.route = route
+        # 发出请求的浏览器
+        self.worker = worker
+        # 请求方法和请求头（直接请求后续分页时复用）
+        self.method = "GET"
+        self.request_headers = {}
+        # 是否由CommentReplayer直接请求得到（而不是浏览器）
+        self.replayed = False
+        self.captured = time.time()
+
+    @classmethod
+    def from_flow(cls, flow, keyword=None, downloader=None, route=None, worker=None):
+        captured = cls(flow.request.url, flow.request.content, flow.response.raw_content,
+                       flow.response.headers.get("content-encoding"), keyword, downloader, route, worker)
+        captured.method = flow.request.method
+        captured.request_headers = dict(flow.request.headers)
+        return captured
+
+    def follow_up(self, url: str, request_content: bytes, response_content: bytes):
+        """同一会话中直接请求得到的后续分页，沿用关键字、下载器、路由、浏览器和请求头"""
+        captured = CapturedFlow(url, request_content, response_content, None, self.keyword, self.downloader,
+                                self.route, self.worker)
+        captured.method = self.method
+        captured.request_headers = self.request_headers
+        captured.replayed = True
+        return captured
+
+    def body(self) -> bytes:
+        """解压后的响应体"""
+        if not self.content_encoding or self.content_encoding == "identity":
+            return self.response_content
+        from mitmproxy.net import encoding
+        return encoding.decode(self.response_content, self.content_encoding)
+
+
+class FlowPipeline:
+    """
+    有界的流量处理队列：代理钩子只负责放入数据，解析、保存评论和提交下载由后台线程完成，
+    队列满时钩子直接丢弃并计数，不阻塞代理的事件循环
+    """
+
+    def __init__(self, handler, thread_num=FLOW_WORKER_NUM, queue_size=FLOW_QUEUE_SIZE, name="flow"):
+        """
+        @param handler: 处理函数，参数为CapturedFlow
+        """
+        self.handler = handler
+        self.name = name
+        self.flows = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # 关键字 -> 已放入但未处理完的流量数
+        self.pending = {}
+        self.submitted_num = 0
+        self.processed_num = 0
+        self.failed_num = 0
+        self.dropped_num = 0
+        # 从捕获到处理完的累计耗时
+        self.latency_sum = 0.0
+        self.workers = []
+        for i in range(thread_num):
+            worker = threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        metrics.register_gauge(f"{name}_pipeline", self.stats)
+
+    def submit(self, captured: CapturedFlow, block: bool = False) -> bool:
+        """
+        放入待处理的流量
+        @param block: 队列满时是否等待（只用于后台线程，代理钩子中不能等待）
+        @return: 队列已满被丢弃时返回False
+        """
+        # 放入前计数，工作线程可能在put返回前就处理完
+        with self.lock:
+            self.pending[captured.keyword] = self.pending.get(captured.keyword, 0) + 1
+        try:
+            self.flows.put(captured, block=block)
+        except queue.Full:
+            self._done(captured.keyword)
+            with self.lock:
+                self.dropped_num += 1
+            log_warn(f"流量处理队列已满，丢弃{captured.url}")
+            return False
+        with self.lock:
+            self.submitted_num += 1
+        return True
+
+    def join(self, keyword=None) -> None:
+        """
+        等待已放入的流量处理完
+        @param keyword: 只等待该关键字的流量，None表示全部
+        """
+        if keyword is None:
+            self.flows.join()
+            return
+        with self.idle:
+            self.idle.wait_for(lambda: keyword not in self.pending)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """处理完队列中的流量后停止后台线程"""
+        for _ in self.workers:
+            self.flows.put(_STOP)
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "queue_depth": self.flows.qsize(),
+                "submitted": self.submitted_num,
+                "processed": self.processed_num,
+                "failed": self.failed_num,
+                "dropped": self.dropped_num,
+                "latency_ms": round(self.latency_sum / self.processed_num * 1000) if self.processed_num else None,
+            }
+
+    def _worker(self) -> None:
+        while True:
+            captured = self.flows.get()
+            try:
+                if captured is _STOP:
+                    return
+                try:
+                    self.handler(captured)
+                except Exception as e:
+                    log_warn(f"处理{captured.url}失败: {e!r}")
+                    with self.lock:
+                        self.failed_num += 1
+                else:
+                    with self.lock:
+                        self.processed_num += 1
+                        self.latency_sum += time.time() - captured.captured
+            finally:
+                if captured is not _STOP:
+                    self._done(captured.keyword)
+                self.flows.task_done()
+
+    def _done(self, keyword) -> None:
+        """关键字的一条流量处理完或被丢弃"""
+        with self.lock:
+            self.pending[keyword] -= 1
+            if not self.pending[keyword]:
+                del self.pending[keyword]
+                self.idle.notify_all()
@@ -0,0 +1,63 @@
+import base64
+import json
+import os
+import threading
+
+from MultiPlatVideoCrawler.conf.config import FLOW_RECORD_PATH
+
+
+class FlowRecorder:
+    """
+    把拦截到的接口流量按行写入jsonl，响应体保留原始的压缩数据，回放时与线上一样经过解压和解析
+    """
+
+    def __init__(self, path=FLOW_RECORD_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        # 按行缓冲，中断时最多丢失最后一行
+        self.file = open(path, "a", encoding="utf-8", buffering=1)
+        self.recorded_num = 0
+
+    def record(self, captured, port: int = None) -> None:
+        """
+        记录一条流量
+        @param captured: CapturedFlow
+        @param port: 浏览器连接的代理端口
+        """
+        line = json.dumps({
+            "url": captured.url,
+            "method": captured.method,
+            "request_headers": captured.request_headers,
+            "request": base64.b64encode(captured.request_content or b"").decode(),
+            "response": base64.b64encode(captured.response_content or b"").decode(),
+            "content_encoding": captured.content_encoding,
+            "keyword": captured.keyword,
+            "route": captured.route.name if captured.route is not None else None,
+            "port": port,
+            "time": captured.captured,
+        }, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.recorded_num += 1
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+    @staticmethod
+    def read(path=FLOW_RECORD_PATH):
+        """
+        读取记录的流量
+        @return: 生成器，每条流量为字典，request/response已还原为bytes
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # 中断时写了一半的行
+                    continue
+                item["request"] = base64.b64decode(item["request"])
+                item["response"] = base64.b64decode(item["response"])
+                yield item
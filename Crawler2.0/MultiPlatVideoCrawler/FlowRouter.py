@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+
+from MultiPlatVideoCrawler.utils.metrics import metrics
+
+
+def host_pattern(hosts) -> str:
+    """
+    mitmdump --allow-hosts使用的正则：只匹配给定的主机（可带端口）
+    @param hosts: 主机名列表，以.开头表示该域名下的所有主机
+    """
+    names = [f"[^:]*{re.escape(host)}" if host.startswith(".") else re.escape(host) for host in sorted(set(hosts))]
+    return f"^({'|'.join(names)})(:[0-9]+)?$"
+
+
+def host_matches(host: str, hosts) -> bool:
+    """主机是否在列表中（以.开头的项匹配该域名下的所有主机）"""
+    return any(host.endswith(h) if h.startswith(".") else host == h for h in hosts)
+
+
+class Route:
+
+    def __init__(self, host: str, path_prefix: str, handler, name: str = None):
+        """
+        @param host: 主机名
+        @param path_prefix: 路径前缀（含查询参数前的部分）
+        @param handler: 处理函数，参数为CapturedFlow
+        @param name: 路由名称，用于统计
+        """
+        self.host = host
+        self.path_prefix = path_prefix
+        self.handler = handler
+        self.name = name or f"{host}{path_prefix}"
+
+
+class FlowRouter:
+    """
+    流量路由表：主机 -> [路由]，先按主机查字典，不相关的流量（图片、脚本、视频分片）一次查找就被排除，
+    新接口只需注册路由，不用修改代理钩子
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+        # 路由名称 -> {"count": 处理次数, "seconds": 累计耗时, "failures": 失败次数}
+        self.route_stats = {}
+
+    def add(self, host: str, path_prefix: str, handler, name: str = None) -> Route:
+        """注册路由，同一主机下较长的前缀优先匹配"""
+        route = Route(host, path_prefix, handler, name)
+        routes = self.routes.setdefault(host, [])
+        routes.append(route)
+        routes.sort(key=lambda r: len(r.path_prefix), reverse=True)
+        return route
+
+    def hosts(self) -> list:
+        """已注册路由的主机"""
+        return list(self.routes)
+
+    def match(self, host: str, path: str):
+        """
+        查找流量对应的路由
+        @return: 路由，没有匹配时返回None
+        """
+        routes = self.routes.get(host)
+        if routes is None:
+            return None
+        for route in routes:
+            if path.startswith(route.path_prefix):
+                return route
+        return None
+
+    def dispatch(self, captured) -> None:
+        """调用流量所属路由的处理函数并统计耗时"""
+        route = captured.route
+        start = time.perf_counter()
+        failed = 0
+        try:
+            route.handler(captured)
+        except Exception:
+            failed = 1
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                item = self.route_stats.setdefault(route.name, {"count": 0, "seconds": 0.0, "failures": 0})
+                item["count"] += 1
+                item["seconds"] += seconds
+                item["failures"] += failed
+
+    def stats(self) -> dict:
+        """每个路由的处理次数、平均耗时和失败次数"""
+        with self.lock:
+            return {name: {"count": item["count"],
+                           "avg_ms": round(item["seconds"] / item["count"] * 1000, 3) if item["count"] else None,
+                           "failures": item["failures"]}
+                    for name, item in self.route_stats.items()}
+
+    def register_metrics(self, name: str = "flow_routes") -> None:
+        metrics.register_gauge(name, self.stats)
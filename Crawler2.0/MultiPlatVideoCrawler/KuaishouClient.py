@@ -0,0 +1,221 @@
+import json
+import queue
+import threading
+import time
+
+from MultiPlatVideoCrawler.CommentReplayer import CommentReplayer
+from MultiPlatVideoCrawler.conf.config import KUAISHOU_BATCH_SIZE, KUAISHOU_BATCH_WAIT, COMMENT_REPLAY_CONCURRENCY, \
+    COMMENT_REPLAY_MAX_PAGES, DOWNLOAD_TIMEOUT, VIDEO_MAX_NUM
+from MultiPlatVideoCrawler.utils import fastjson
+from MultiPlatVideoCrawler.utils.log import log_warn
+
+# 合并线程退出标记
+_STOP = object()
+
+
+class KuaishouClient(CommentReplayer):
+    """
+    快手GraphQL批量客户端：评论分页和搜索分页的请求先放入队列，同一浏览器会话的多个操作合并成JSON数组一次发送，
+    响应数组按顺序拆回单个操作放入流量处理队列，与浏览器拦截到的请求一样处理。接口不接受数组时改为逐个请求。
+    搜索结果到达时直接请求其中每个视频的第一页评论，浏览器不用逐个点开视频
+    """
+
+    def __init__(self, pipeline, batch_size=KUAISHOU_BATCH_SIZE, batch_wait=KUAISHOU_BATCH_WAIT,
+                 concurrency=COMMENT_REPLAY_CONCURRENCY, max_pages=COMMENT_REPLAY_MAX_PAGES, max_videos=VIDEO_MAX_NUM):
+        """
+        @param batch_size: 每次请求最多合并的操作数
+        @param batch_wait: 凑满一批最多等待的秒数
+        @param max_videos: 每个关键字最多翻到的视频数
+        """
+        super().__init__(pipeline, concurrency, max_pages)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_videos = max_videos
+        # 接口是否接受批量请求：None未知 / True / False
+        self.batch_supported = None
+        self.round_trips = 0
+        self.operations_num = 0
+        # 浏览器发出的评论查询，作为直接请求评论的模板；模板到达前的搜索结果先暂存
+        self.comment_query = None
+        self.waiting = []
+        # 关键字 -> 已收到的视频数 / 已收到的搜索分页游标；已翻完的关键字
+        self.search_videos = {}
+        self.search_cursors = {}
+        self.search_finished = set()
+        self.operations = queue.Queue()
+        self.batcher = threading.Thread(target=self._batch_loop, name="kuaishou-batcher", daemon=True)
+        self.batcher.start()
+
+    def learn(self, query: dict) -> None:
+        """
+        记下浏览器发出的评论查询，开始请求暂存的搜索结果中视频的评论
+        @param query: 浏览器拦截到的评论分页的GraphQL查询
+        """
+        with self.lock:
+            if self.comment_query is not None:
+                return
+            self.comment_query = query
+            waiting, self.waiting = self.waiting, []
+        for item in waiting:
+            self.prefetch(*item)
+
+    def prefetch(self, captured, photo_id, pcursor: str = "") -> bool:
+        """
+        不等浏览器点开，直接请求视频的评论
+        @param captured: 视频所在的搜索分页
+        @param pcursor: 从哪一页开始（断点），""表示第一页
+        @return: 是否提交了请求（视频已在请求中或还没有评论查询模板时返回False）
+        """
+        with self.lock:
+            if captured.keyword in self.finished:
+                return False
+            query = self.comment_query
+            if query is None:
+                self.waiting.append((captured, photo_id, pcursor))
+                return False
+        if not self._admit(captured, photo_id, True):
+            return False
+        body = json.dumps(dict(query, variables=dict(query['variables'], photoId=photo_id, pcursor=pcursor)))
+        self._request(captured, captured.url, body.encode())
+        return True
+
+    def follow_search(self, captured, query: dict, pcursor, videos: int) -> bool:
+        """
+        请求下一页搜索结果
+        @param captured: 刚处理完的搜索分页
+        @param query: 这一页的GraphQL查询
+        @param pcursor: 下一页的游标，None表示没有下一页
+        @param videos: 这一页的视频数
+        @return: 是否提交了请求
+        """
+        keyword = captured.keyword
+        with self.lock:
+            # 浏览器和直接请求可能收到同一页，只计一次
+            cursors = self.search_cursors.setdefault(keyword, set())
+            if str(query['variables'].get('pcursor')) not in cursors:
+                cursors.add(str(query['variables'].get('pcursor')))
+                self.search_videos[keyword] = self.search_videos.get(keyword, 0) + videos
+            seen = self.search_videos[keyword]
+        if pcursor is None or seen >= self.max_videos:
+            with self.lock:
+                self.search_finished.add(keyword)
+            return False
+        # 分页计数的键包含关键字，搜索分页按关键字各计一个
+        if not self._admit(captured, "search", not captured.replayed):
+            if captured.replayed:
+                # 达到分页上限
+                with self.lock:
+                    self.search_finished.add(keyword)
+            return False
+        body = json.dumps(dict(query, variables=dict(query['variables'], pcursor=pcursor)))
+        self._request(captured, captured.url, body.encode())
+        return True
+
+    def forget(self, keyword) -> None:
+        super().forget(keyword)
+        with self.lock:
+            # 等待评论查询模板的搜索结果也丢弃，模板到达后不会再为已结束的关键字请求评论
+            self.waiting = [item for item in self.waiting if item[0].keyword != keyword]
+            self.search_videos.pop(keyword, None)
+            self.search_cursors.pop(keyword, None)
+            self.search_finished.discard(keyword)
+
+    def search_done(self, keyword) -> bool:
+        """关键字的搜索结果是否已翻完（浏览器可以停止点下一个）"""
+        with self.lock:
+            return keyword in self.search_finished
+
+    def _request(self, captured, url: str, request_content: bytes) -> None:
+        self.operations.put((captured, url, request_content))
+
+    def _batch_loop(self) -> None:
+        while True:
+            operation = self.operations.get()
+            if operation is _STOP:
+                return
+            batch = [operation]
+            deadline = time.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    operation = self.operations.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if operation is _STOP:
+                    # 先发完这一批
+                    self.operations.put(_STOP)
+                    break
+                batch.append(operation)
+            # 同一浏览器会话（相同cookie）发往同一接口的操作才能合并
+            groups = {}
+            for operation in batch:
+                groups.setdefault((id(operation[0].worker), operation[1]), []).append(operation)
+            for operations in groups.values():
+                self.executor.submit(self._send, operations)
+
+    def _send(self, operations: list) -> None:
+        """发送一批操作，不能批量时逐个请求；排队期间关键字已结束的操作不再发送"""
+        for operation in [o for o in operations if self.is_finished(o[0])]:
+            operations.remove(operation)
+            self._finish(operation[0])
+        if not operations:
+            return
+        results = self._post_batch(operations) if len(operations) > 1 and self.batch_supported is not False else None
+        if results is None:
+            for operation in operations:
+                self._fetch(*operation)
+            return
+        for (captured, url, request_content), result in zip(operations, results):
+            try:
+                self._submit(captured, url, request_content, json.dumps(result, ensure_ascii=False).encode())
+            finally:
+                self._finish(captured)
+
+    def _post_batch(self, operations: list):
+        """
+        @return: 每个操作的响应，请求失败或接口不接受批量时返回None
+        """
+        captured, url, _ = operations[0]
+        body = b"[" + b",".join(operation[2] for operation in operations) + b"]"
+        try:
+            resp = self.session.request("POST", url, data=body, headers=self._headers(captured),
+                                        timeout=DOWNLOAD_TIMEOUT)
+            with self.lock:
+                self.round_trips += 1
+                self.operations_num += len(operations)
+        except Exception as e:
+            log_warn(f"快手批量请求失败: {e!r}")
+            return None
+        if not resp.ok and resp.status_code != 400:
+            # 限流、服务器错误等与是否接受数组无关，这一批逐个请求，之后仍然合并
+            log_warn(f"快手批量请求失败: {resp.status_code}")
+            return None
+        try:
+            results = fastjson.loads(resp.content) if resp.ok else None
+        except ValueError:
+            results = None
+        # 接口拒绝数组（400）或返回的不是等长的数组时才改为逐个请求
+        if not isinstance(results, list) or len(results) != len(operations):
+            if self.batch_supported is None:
+                log_warn("快手GraphQL不接受批量请求，改为逐个请求")
+            self.batch_supported = False
+            return None
+        self.batch_supported = True
+        return results
+
+    def _fetch(self, captured, url: str, request_content: bytes) -> None:
+        with self.lock:
+            self.round_trips += 1
+            self.operations_num += 1
+        super()._fetch(captured, url, request_content)
+
+    def shutdown(self) -> None:
+        self.operations.put(_STOP)
+        self.batcher.join()
+        super().shutdown()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self.lock:
+            stats.update(batch_supported=self.batch_supported, round_trips=self.round_trips,
+                         operations=self.operations_num, searches_finished=len(self.search_finished))
+        return stats
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from MultiPlatVideoCrawler.conf.config import MIRROR_RACE_NUM, MIRROR_STALL_TIMEOUT, MIRROR_MIN_SPEED, \
+    DOWNLOAD_TIMEOUT, AIMD_MAX_CONCURRENCY, SEARCH_WORKER_NUM
+from MultiPlatVideoCrawler.utils.http import get_session
+from MultiPlatVideoCrawler.utils.metrics import metrics
+
+
+class MirrorStalled(IOError):
+    """镜像下载速度过低，需要切换到其他镜像"""
+
+
+class MirrorSelector:
+    """
+    记录每个CDN节点的首字节延迟（指数加权平均），
+    下载时优先选择更快的节点，并同时请求多个镜像取最先响应的一个
+    """
+
+    # 新延迟的权重
+    ALPHA = 0.3
+    # 失败时记入的延迟惩罚（秒）
+    FAIL_PENALTY = 10.0
+
+    def __init__(self, race_num=MIRROR_RACE_NUM, thread_num=AIMD_MAX_CONCURRENCY * SEARCH_WORKER_NUM * MIRROR_RACE_NUM):
+        """
+        @param thread_num: 竞速线程数，按同时下载的线程数（每个浏览器一个下载器）乘以竞速的镜像数，
+                           竞速请求不用排队，排队会让后提交的镜像输掉竞速
+        """
+        self.race_num = race_num
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=thread_num, thread_name_prefix="mirror")
+
+    @property
+    def session(self):
+        """共享连接池（第一次下载时才创建，导入模块时不创建）"""
+        return get_session()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).hostname
+
+    def record(self, url: str, latency: float) -> None:
+        """记录一次首字节延迟"""
+        host = self.host(url)
+        with self.lock:
+            old = self.latency.get(host)
+            self.latency[host] = latency if old is None else old * (1 - self.ALPHA) + latency * self.ALPHA
+
+    def record_failure(self, url: str) -> None:
+        self.record(url, self.FAIL_PENALTY)
+
+    def rank(self, urls) -> list:
+        """
+        按延迟从低到高排序，未测过的节点排在已知节点的平均延迟处，保证会被尝试
+        @param urls: 镜像链接列表
+        """
+        with self.lock:
+            known = [v for v in self.latency.values()]
+            default = sum(known) / len(known) if known else 0.0
+            return sorted(urls, key=lambda u: self.latency.get(self.host(u), default))
+
+    def snapshot(self) -> dict:
+        """每个节点当前的平均延迟（毫秒）"""
+        with self.lock:
+            return {host: round(v * 1000) for host, v in self.latency.items()}
+
+    def open(self, url: str, header: dict, timeout=DOWNLOAD_TIMEOUT):
+        """请求一个镜像并记录首字节延迟，返回流式响应"""
+        start = time.time()
+        try:
+            resp = self.session.get(url, headers=header, stream=True, timeout=timeout)
+            resp.raise_for_status()
+        except Exception:
+            # 还可以换用其他镜像，记为重试，视频最终下载失败时由下载器记为失败
+            self.record_failure(url)
+            metrics.add(self.host(url), retries=1)
+            raise
+        self.record(url, time.time() - start)
+        metrics.ttfb(url, time.time() - start)
+        return resp
+
+    def race(self, urls, header: dict, timeout=DOWNLOAD_TIMEOUT):
+        """
+        同时请求排名最前的几个镜像，返回最先响应成功的一个，其余响应关闭
+        @param urls: 已排序的镜像链接列表
+        @return: (链接, 流式响应)
+        """
+        candidates = urls[:self.race_num]
+        if len(candidates) == 1:
+            return candidates[0], self.open(candidates[0], header, timeout)
+        futures = {self.executor.submit(self.open, url, header, timeout): url for url in candidates}
+        error = None
+        for future in as_completed(futures):
+            try:
+                resp = future.result()
+            except Exception as e:
+                error = e
+                continue
+            # 落后的镜像响应后直接关闭
+            for other in futures:
+                if other is not future:
+                    other.add_done_callback(_close_response)
+            return futures[future], resp
+        raise error
+
+    def open_any(self, urls, header: dict, timeout=DOWNLOAD_TIMEOUT):
+        """
+        先竞速请求排名最前的镜像，全部失败时依次尝试剩余镜像
+        @param urls: 已排序的镜像链接列表
+        @return: (链接, 流式响应)
+        """
+        try:
+            return self.race(urls, header, timeout)
+        except Exception as e:
+            error = e
+        for url in urls[self.race_num:]:
+            try:
+                return url, self.open(url, header, timeout)
+            except Exception as e:
+                error = e
+        raise error
+
+    @staticmethod
+    def check_speed(start: float, size: int) -> None:
+        """下载一段时间后速度仍低于下限时抛出MirrorStalled"""
+        elapsed = time.time() - start
+        if elapsed > MIRROR_STALL_TIMEOUT and size / elapsed < MIRROR_MIN_SPEED:
+            raise MirrorStalled(f"下载速度过低: {size / elapsed:.0f}B/s")
+
+
+def _close_response(future) -> None:
+    if future.exception() is None:
+        future.result().close()
+
+
+# 所有下载器共用，节点延迟在关键字之间保留
+mirror_selector = MirrorSelector()
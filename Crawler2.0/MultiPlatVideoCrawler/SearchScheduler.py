@@ -0,0 +1,148 @@
+import json
+import os
+import queue
+import threading
+
+from MultiPlatVideoCrawler.conf.config import HOST_RATE_LIMITS, DEFAULT_RATE_LIMIT
+from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.ratelimit import TokenBucket
+
+
+class SearchWorker:
+    """
+    一个浏览器搜索线程：独立的浏览器（独立的用户文件副本）和代理端口，
+    代理中按连接的监听端口找到对应的搜索线程，从而知道流量属于哪个关键字
+    """
+
+    def __init__(self, index: int, port: int, platform: str):
+        self.index = index
+        # 浏览器使用的代理端口
+        self.port = port
+        # 当前搜索的关键字id及其下载器（由lock保护，两者同时切换）
+        self.keyword = None
+        self.downloader = None
+        self.lock = threading.Lock()
+        # 每个浏览器翻到下一个视频的最快节奏
+        self.pacer = TokenBucket(*HOST_RATE_LIMITS.get(f"{platform}-browser", DEFAULT_RATE_LIMIT))
+        # 代理收到的评论分页数，浏览器据此判断当前视频的评论是否已加载
+        self.comment_pages = 0
+        self.comment_cond = threading.Condition()
+
+    def switch(self, keyword, downloader) -> None:
+        """同时切换关键字和下载器"""
+        with self.lock:
+            self.keyword = keyword
+            self.downloader = downloader
+
+    def current(self) -> tuple:
+        """
+        @return: (关键字id, 下载器)，两者属于同一个关键字
+        """
+        with self.lock:
+            return self.keyword, self.downloader
+
+    def comment_received(self) -> None:
+        """代理收到这个浏览器的一页评论"""
+        with self.comment_cond:
+            self.comment_pages += 1
+            self.comment_cond.notify_all()
+
+    def wait_comment(self, seen: int, timeout: float) -> bool:
+        """
+        等待代理收到新的评论分页
+        @param seen: 操作浏览器前的comment_pages
+        @return: 超时返回False
+        """
+        with self.comment_cond:
+            return self.comment_cond.wait_for(lambda: self.comment_pages > seen, timeout)
+
+    @property
+    def name(self) -> str:
+        return f"search-worker-{self.index}"
+
+
+class SearchScheduler:
+    """
+    多浏览器并行搜索：关键字放在共享队列中，每个浏览器搜完一个关键字就领取下一个
+    """
+
+    def __init__(self, keywords: list, worker_num: int, base_port: int, platform: str):
+        """
+        @param keywords: 关键字列表（按keyword_order排序）
+        @param worker_num: 浏览器数量
+        @param base_port: 第一个浏览器的代理端口，其余依次加1
+        """
+        self.keywords = queue.Queue()
+        for keyword in keywords:
+            self.keywords.put(keyword)
+        # 未搜完的关键字id，用于记录断点
+        self.remaining = [k['keyword_order'] for k in keywords]
+        self.lock = threading.Lock()
+        self.workers = [SearchWorker(i, base_port + i, platform) for i in range(max(1, worker_num))]
+        self.ports = {w.port: w for w in self.workers}
+
+    def worker_for_port(self, port: int):
+        """
+        按代理监听端口查找搜索线程
+        @return: 搜索线程，端口未知时：只有一个浏览器则返回它，否则返回None
+        """
+        worker = self.ports.get(port)
+        if worker is None and len(self.workers) == 1:
+            return self.workers[0]
+        return worker
+
+    def next_keyword(self):
+        """
+        领取下一个关键字
+        @return: 关键字，全部领完时返回None
+        """
+        try:
+            return self.keywords.get_nowait()
+        except queue.Empty:
+            return None
+
+    def keyword_done(self, keyword_order) -> None:
+        with self.lock:
+            if keyword_order in self.remaining:
+                self.remaining.remove(keyword_order)
+
+    def resume_point(self):
+        """
+        重启时应从哪个关键字开始：最早的未搜完的关键字
+        @return: 关键字id，全部搜完时返回None
+        """
+        with self.lock:
+            return self.remaining[0] if self.remaining else None
+
+    def save_resume_point(self, path: str) -> None:
+        """
+        把断点写入文件：持有锁写临时文件再替换，多个浏览器同时切换关键字时不会写出半截或过期的断点
+        @param path: 断点文件（LastKeyIN{平台}.json）
+        """
+        tmp_path = f"{path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "Lastkeyword": self.remaining[0] if self.remaining else None
+                }, f)
+            os.replace(tmp_path, path)
+
+    def run(self, target) -> None:
+        """
+        每个浏览器一个线程执行target(worker)，等待全部结束
+        @param target: 搜索函数，参数为SearchWorker
+        """
+        threads = []
+        for worker in self.workers:
+            thread = threading.Thread(target=self._run_worker, args=(target, worker), name=worker.name)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def _run_worker(target, worker: SearchWorker) -> None:
+        try:
+            target(worker)
+        except Exception as e:
+            log_warn(f"{worker.name}异常退出: {e!r}")
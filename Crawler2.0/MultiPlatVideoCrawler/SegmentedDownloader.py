@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from MultiPlatVideoCrawler.conf.config import SEGMENT_SIZE, SEGMENT_THREAD_NUM, DOWNLOAD_CHUNK_SIZE, \
+    DOWNLOAD_TIMEOUT
+from MultiPlatVideoCrawler.MirrorSelector import mirror_selector
+from MultiPlatVideoCrawler.utils.http import get_session
+from MultiPlatVideoCrawler.utils.metrics import metrics, host_of
+
+
+class SegmentedDownloader:
+    """
+    分段并行下载：按Range把大视频切成若干段并行下载到.part文件，
+    已完成的分段记录在旁路进度文件(.part.json)中，中断后从未完成的分段继续
+    """
+
+    def __init__(self, header: dict, segment_size=SEGMENT_SIZE, thread_num=SEGMENT_THREAD_NUM,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, keyword=None):
+        self.header = header
+        self.keyword = keyword
+        self.segment_size = segment_size
+        self.chunk_size = chunk_size
+        self.session = get_session()
+        # 所有视频共用的分段下载线程池
+        self.executor = ThreadPoolExecutor(max_workers=thread_num, thread_name_prefix="segment")
+
+    @staticmethod
+    def total_size(resp) -> int:
+        """
+        从响应头中读取视频总大小
+        @param resp: requests响应
+        @return: 总字节数，未知时返回-1
+        """
+        content_range = resp.headers.get("Content-Range")
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                return int(total)
+        content_length = resp.headers.get("Content-Length")
+        if resp.status_code == 200 and content_length and content_length.isdigit():
+            return int(content_length)
+        return -1
+
+    @staticmethod
+    def progress_path(path: str) -> str:
+        return f"{path}.part.json"
+
+    def has_progress(self, path: str) -> bool:
+        """是否存在可以续传的下载进度"""
+        return os.path.exists(self.progress_path(path)) and os.path.exists(f"{path}.part")
+
+    def probe(self, url: str) -> int:
+        """
+        请求第一个字节，探测视频总大小
+        @return: 总字节数，服务器不支持Range时返回-1
+        """
+        header = dict(self.header, Range="bytes=0-0")
+        with self.session.get(url, headers=header, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                return -1
+            return self.total_size(resp)
+
+    def download(self, urls, path: str, size: int = -1) -> int:
+        """
+        分段下载视频，完成后把.part文件改名为目标文件
+        @param urls: 视频链接或按优先级排序的镜像链接列表，分段失败时依次换用下一个镜像
+        @param path: 保存路径
+        @param size: 视频总大小，未知时从进度文件读取或重新探测
+        @return: 视频总大小
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        url = urls[0]
+        part_path = f"{path}.part"
+        progress = self._load_progress(path)
+        if size < 0:
+            size = progress["size"] if progress else self.probe(url)
+            if size < 0:
+                raise IOError(f"{url} 不支持分段下载")
+        if progress is None or progress["size"] != size or progress["segment_size"] != self.segment_size \
+                or not os.path.exists(part_path):
+            # 没有可用的进度，预分配.part文件从头下载
+            progress = {"url": url, "size": size, "segment_size": self.segment_size, "done": []}
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+            self._save_progress(path, progress)
+
+        done = set(progress["done"])
+        lock = threading.Lock()
+        segments = []
+        for index, start in enumerate(range(0, size, self.segment_size)):
+            if index not in done:
+                segments.append((index, start, min(start + self.segment_size, size) - 1))
+
+        def fetch(segment):
+            index, start, end = segment
+            for i, mirror in enumerate(urls):
+                try:
+                    self._fetch_segment(mirror, part_path, start, end)
+                    break
+                except Exception:
+                    mirror_selector.record_failure(mirror)
+                    metrics.add(host_of(mirror), self.keyword, retries=1)
+                    if i == len(urls) - 1:
+                        raise
+            with lock:
+                done.add(index)
+                progress["done"] = sorted(done)
+                self._save_progress(path, progress)
+
+        # 任意分段失败都会抛出异常，已完成的分段保留在进度文件中
+        for future in [self.executor.submit(fetch, s) for s in segments]:
+            future.result()
+
+        os.replace(part_path, path)
+        os.remove(self.progress_path(path))
+        return size
+
+    def _fetch_segment(self, url: str, part_path: str, start: int, end: int) -> None:
+        """下载[start, end]字节并写入.part文件的对应位置"""
+        header = dict(self.header, Range=f"bytes={start}-{end}")
+        begin = time.time()
+        with self.session.get(url, headers=header, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+            resp.raise_for_status()
+            metrics.ttfb(url, time.time() - begin)
+            if resp.status_code != 206:
+                raise IOError(f"{url} 未返回分段内容: {resp.status_code}")
+            written = 0
+            with open(part_path, "r+b") as f:
+                f.seek(start)
+                for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+        metrics.add(host_of(url), self.keyword, bytes=written, seconds=time.time() - begin)
+        if written != end - start + 1:
+            raise IOError(f"分段{start}-{end}不完整: {written}字节")
+
+    def _load_progress(self, path: str):
+        try:
+            with open(self.progress_path(path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_progress(self, path: str, progress: dict) -> None:
+        # 先写临时文件再替换，崩溃时不会留下半截的进度文件
+        tmp_path = f"{self.progress_path(path)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, self.progress_path(path))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
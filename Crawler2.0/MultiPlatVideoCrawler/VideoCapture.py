@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from MultiPlatVideoCrawler.DownloadManifest import get_manifest, DONE
+from MultiPlatVideoCrawler.FlowRouter import host_matches
+from MultiPlatVideoCrawler.VideoStore import get_video_store
+from MultiPlatVideoCrawler.conf.config import VIDEO_CAPTURE_HOSTS, VIDEO_CAPTURE_WAIT, VIDEO_CAPTURE_THREAD_NUM, \
+    DOWNLOAD_MANIFEST, VALIDATE_MP4
+from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.metrics import metrics
+from MultiPlatVideoCrawler.utils.mp4 import check_mp4
+
+# 视频状态
+WAITING = "waiting"
+CAPTURING = "capturing"
+CAPTURED = "captured"
+
+
+def capture_key(url: str) -> str:
+    """
+    用于匹配浏览器请求与搜索结果中的视频链接：只取路径，抖音的镜像和签名只影响/video/tos/之前的部分
+    """
+    path = urlsplit(url).path
+    i = path.find("/video/tos/")
+    return path[i:] if i >= 0 else path
+
+
+def full_size(response):
+    """
+    @return: 响应是完整视频时返回大小（未知时为-1），只是视频的一部分时返回None
+    """
+    if response.headers.get("content-encoding", "identity") != "identity":
+        return None
+    if response.status_code == 200:
+        length = response.headers.get("content-length")
+        return int(length) if length and length.isdigit() else -1
+    if response.status_code == 206:
+        # 浏览器从头播放时请求Range: bytes=0-，服务器返回整个文件
+        match = re.match(r"bytes 0-(\d+)/(\d+)", response.headers.get("content-range", ""))
+        if match and int(match[1]) + 1 == int(match[2]):
+            return int(match[2])
+    return None
+
+
+class CapturedVideo:
+    """搜索结果中等待浏览器播放的视频（由VideoCapture的锁保护）"""
+
+    def __init__(self, keyword, vid, urls: list, save_path: str):
+        self.keyword = keyword
+        self.vid = vid
+        self.urls = urls
+        self.save_path = save_path
+        self.keys = set()
+        self.state = WAITING
+
+
+class CaptureWriter:
+    """
+    作为flow.response.stream：代理每转发一块视频数据就写入临时文件，原样返回数据给浏览器
+    """
+
+    def __init__(self, video: CapturedVideo, path: str, expected: int):
+        self.video = video
+        self.path = path
+        self.expected = expected
+        self.file = open(path, "wb")
+        self.size = 0
+        self.failed = False
+        self.finished = False
+
+    def __call__(self, data: bytes) -> bytes:
+        if data and not self.failed:
+            try:
+                self.file.write(data)
+                self.size += len(data)
+            except OSError:
+                # 写入失败不影响浏览器播放，这个视频交给下载器
+                self.failed = True
+        return data
+
+
+class VideoCapture:
+    """
+    视频旁路保存：搜索结果中的视频先登记，浏览器播放时代理把视频响应写入视频库，
+    关键字结束时只有没被播放过的视频交给下载器
+    """
+
+    def __init__(self, platform: str, thread_num=VIDEO_CAPTURE_THREAD_NUM, wait=VIDEO_CAPTURE_WAIT):
+        """
+        @param thread_num: 校验和入库的线程数（不占用代理的事件循环）
+        @param wait: 关键字结束时等待正在写入的视频的最长时间（秒）
+        """
+        self.platform = platform
+        self.hosts = VIDEO_CAPTURE_HOSTS.get(platform, [])
+        self.wait = wait
+        self.store = get_video_store()
+        self.manifest = get_manifest() if DOWNLOAD_MANIFEST else None
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # 视频id -> CapturedVideo；链接路径 -> 视频id
+        self.videos = {}
+        self.keys = {}
+        self.executor = ThreadPoolExecutor(thread_num, thread_name_prefix="video-capture")
+        self.captured_num = 0
+        self.failed_num = 0
+        self.bytes_num = 0
+        metrics.register_gauge("video_capture", self.stats)
+
+    def register(self, keyword, vid, urls, save_path: str, play_urls=()) -> bool:
+        """
+        登记搜索结果中的视频
+        @param urls: 下载链接或镜像链接列表
+        @param save_path: 关键字的video文件夹
+        @param play_urls: 浏览器播放时使用的链接
+        @return: 视频已由其他关键字登记时返回False（应直接交给下载器）
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        with self.lock:
+            video = self.videos.get(vid)
+            if video is None:
+                video = self.videos[vid] = CapturedVideo(keyword, vid, urls, save_path)
+            elif video.keyword != keyword:
+                return False
+            for url in urls + list(play_urls):
+                key = capture_key(url)
+                video.keys.add(key)
+                self.keys[key] = vid
+        return True
+
+    def open(self, flow):
+        """
+        在responseheaders钩子中调用：响应是已登记视频的完整内容时开始写入
+        @return: CaptureWriter，不需要保存时返回None
+        """
+        if not host_matches(flow.request.host, self.hosts):
+            return None
+        with self.lock:
+            video = self.videos.get(self.keys.get(capture_key(flow.request.url)))
+            if video is None or video.state != WAITING:
+                return None
+            expected = full_size(flow.response)
+            if expected is None:
+                return None
+            video.state = CAPTURING
+        path = f"{self.store.path(self.platform, video.vid)}.capture"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return CaptureWriter(video, path, expected)
+        except OSError as e:
+            log_warn(f"无法保存播放中的视频{video.vid}: {e!r}")
+            with self.lock:
+                video.state = WAITING
+            return None
+
+    def finish(self, writer: CaptureWriter, error=None) -> None:
+        """
+        响应转发结束（response钩子）或连接中断（error钩子），校验和入库交给后台线程
+        @param error: 连接中断的原因
+        """
+        if writer.finished:
+            return
+        writer.finished = True
+        self.executor.submit(self._finalize, writer, error)
+
+    def _finalize(self, writer: CaptureWriter, error) -> None:
+        video = writer.video
+        writer.file.close()
+        problem = error or ("写入失败" if writer.failed else None)
+        if problem is None:
+            problem = check_mp4(writer.path, writer.expected) if VALIDATE_MP4 else None
+        if problem is None and writer.expected >= 0 and writer.size != writer.expected:
+            problem = f"大小不符: {writer.size}/{writer.expected}"
+        try:
+            if problem is not None:
+                os.remove(writer.path)
+                log_warn(f"播放中的视频{video.vid}未完整保存({problem})，留给下载器")
+                with self.lock:
+                    self.failed_num += 1
+                    video.state = WAITING
+                return
+            # 与下载器共用视频库的独占和去重
+            with self.store.claim(self.platform, video.vid):
+                if self.store.has(self.platform, video.vid):
+                    os.remove(writer.path)
+                else:
+                    os.replace(writer.path, self.store.path(self.platform, video.vid))
+                    self.store.add(self.platform, video.vid)
+            self.store.link(self.platform, video.vid, video.save_path)
+            if self.manifest is not None:
+                self.manifest.add(self.platform, video.keyword, video.vid, video.urls, video.save_path)
+                self.manifest.mark(self.platform, video.keyword, video.vid, DONE, size=writer.size)
+            metrics.add(keyword=video.keyword, files=1)
+            log_warn(f"保存播放中的视频{video.vid}.mp4成功")
+            with self.lock:
+                self.captured_num += 1
+                self.bytes_num += writer.size
+                video.state = CAPTURED
+        except Exception as e:
+            log_warn(f"保存播放中的视频{video.vid}失败: {e!r}")
+            with self.lock:
+                self.failed_num += 1
+                video.state = WAITING
+        finally:
+            with self.lock:
+                self.idle.notify_all()
+
+    def finish_keyword(self, keyword, downloader) -> int:
+        """
+        关键字结束：等正在写入的视频保存完，没有被播放的视频交给下载器
+        @return: 交给下载器的视频数
+        """
+        with self.idle:
+            self.idle.wait_for(lambda: not any(v.keyword == keyword and v.state == CAPTURING
+                                               for v in self.videos.values()), self.wait)
+            videos = [v for v in self.videos.values() if v.keyword == keyword]
+            for video in videos:
+                del self.videos[video.vid]
+                for key in video.keys:
+                    if self.keys.get(key) == video.vid:
+                        del self.keys[key]
+        num = 0
+        for video in videos:
+            # 超时仍在写入的视频也交给下载器，先完成的一方入库，另一方在视频库中跳过
+            if video.state != CAPTURED:
+                downloader.download_control("download", (video.vid, video.urls))
+                num += 1
+        log_warn(f"关键字{keyword}：播放时保存{len(videos) - num}个视频，{num}个交给下载器")
+        return num
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"waiting": len(self.videos), "captured": self.captured_num, "failed": self.failed_num,
+                    "bytes": self.bytes_num}
@@ -1,32 +1,114 @@
-import collections
+import os
+import queue
 import threading
+import time
+
 import requests
 from threading import Thread
 
-from MultiPlatVideoCrawler.conf.config import VIDEO_MAX_NUM
+from MultiPlatVideoCrawler.conf.config import VIDEO_MAX_NUM, DOWNLOAD_QUEUE_SIZE, DOWNLOAD_STREAM, \
+    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT, DOWNLOAD_SEGMENTED, SEGMENT_MIN_SIZE, \
+    DOWNLOAD_BACKEND, MIRROR_STALL_TIMEOUT, VIDEO_STORE, DOWNLOAD_MANIFEST, VALIDATE_MP4, VALIDATE_RETRIES, \
+    QUARANTINE_PATH, DOWNLOAD_ADAPTIVE, AIMD_MAX_CONCURRENCY
+from MultiPlatVideoCrawler.DownloadManifest import get_manifest, DONE, FAILED
+from MultiPlatVideoCrawler.MirrorSelector import mirror_selector, MirrorStalled
+from MultiPlatVideoCrawler.SegmentedDownloader import SegmentedDownloader
+from MultiPlatVideoCrawler.VideoStore import get_video_store
+from MultiPlatVideoCrawler.utils.aimd import aimd, is_congestion
+from MultiPlatVideoCrawler.utils.http import format_connection_stats
 from MultiPlatVideoCrawler.utils.log import log_warn
+from MultiPlatVideoCrawler.utils.metrics import metrics, host_of
+from MultiPlatVideoCrawler.utils.mp4 import check_mp4
+
+# 工作线程退出标记
+_STOP = object()
+
+
+def create_downloader(save_path, platform, thread_num=10, backend=DOWNLOAD_BACKEND, keyword=None):
+    """
+    按配置创建下载器
+    @param backend: thread 多线程下载器 / async 协程下载器
+    @param keyword: 关键字id，用于按关键字统计指标
+    """
+    if backend == "async":
+        # aiohttp只在使用协程后端时才需要
+        from MultiPlatVideoCrawler.AsyncVideoDownloader import AsyncVideoDownloader
+        return AsyncVideoDownloader(save_path, platform, keyword=keyword)
+    return VideoMultiThreadDownloader(save_path, platform, thread_num, keyword=keyword)
+
+
+def resume_downloads(platform, thread_num=10) -> int:
+    """
+    继续上次运行中未完成的下载：后台线程按关键字依次下载，同一时间只有一个下载器，
+    重启时不会为每个有未完成视频的关键字同时创建一组下载线程
+    @return: 待继续下载的视频数
+    """
+    if not DOWNLOAD_MANIFEST:
+        return 0
+    groups = {}
+    for keyword, vid, urls, save_path in get_manifest().unfinished(platform):
+        groups.setdefault((keyword, save_path), []).append((vid, urls))
+    num = sum(len(videos) for videos in groups.values())
+    if num:
+        log_warn(f"继续{num}个未完成的{platform}视频下载")
+        Thread(target=_resume_groups, args=(platform, thread_num, groups), name=f"{platform}-resume",
+               daemon=True).start()
+    return num
+
+
+def _resume_groups(platform, thread_num, groups: dict) -> None:
+    """逐个关键字下载未完成的视频，一个关键字下载完再开始下一个"""
+    for (keyword, save_path), videos in groups.items():
+        downloader = create_downloader(save_path, platform, thread_num, keyword=keyword)
+        for video_t in videos:
+            downloader.submit(video_t)
+        downloader.shutdown(wait=True)
 
 
 class VideoMultiThreadDownloader:
-    # 空闲线程数
-    free_thread_num = 0
 
-    def __init__(self, save_path, platform, thread_num=10):
+    def __init__(self, save_path, platform, thread_num=10, queue_size=DOWNLOAD_QUEUE_SIZE,
+                 stream=DOWNLOAD_STREAM, chunk_size=DOWNLOAD_CHUNK_SIZE, segmented=DOWNLOAD_SEGMENTED, keyword=None):
         super().__init__()
 
-        self.video_order = 0
-        self.video_download_task = collections.deque()
         self.save_path = save_path
+        self.keyword = keyword
+        # 流式下载及块大小
+        self.stream = stream
+        self.chunk_size = chunk_size
+        # 按主机自适应并发，线程数按上限创建，实际并发由控制器决定
+        self.adaptive = aimd if DOWNLOAD_ADAPTIVE else None
+        if self.adaptive is not None:
+            thread_num = max(thread_num, AIMD_MAX_CONCURRENCY)
         self.thread_num = thread_num
-        self.free_thread_num = thread_num
         self.platform = platform
+        # 已提交的视频数
         self.video_num = 0
+        # 正在下载（已占用主机并发名额）的线程数
+        self.active_num = 0
+        # 每个下载线程当前占用并发名额的主机
+        self.local = threading.local()
+        # 已提交但尚未结束（成功/失败/取消）的任务数
+        self.pending_num = 0
+        self.finished_num = 0
+        self.failed_num = 0
+        # 视频库中已有、跳过下载的视频数
+        self.skipped_num = 0
+        # 已下载的字节数及开始时间，用于比较不同后端的吞吐量
+        self.bytes_num = 0
+        self.start_time = time.time()
+        # 所有计数器共用同一把锁
+        self.lock = threading.RLock()
+        self.all_done = threading.Condition(self.lock)
+        # 有界任务队列，由固定数量的常驻线程消费
+        self.video_download_task = queue.Queue(maxsize=queue_size)
+        self.cancelled = threading.Event()
+        self.closed = False
         header1 = {
             "Accept": "*/*",
             "Accept-Encoding": "identity;q=1, *;q=0",
             "Accept-Language": "zh-CN,zh;q=0.9",
             "Connection": "keep-alive",
-            "Host": "v26-web.douyinvod.com",
             "Origin": "https://www.douyin.com",
             "Range": "bytes=0-",
             "Referer": "https://www.douyin.com/",
@@ -39,7 +121,6 @@ class VideoMultiThreadDownloader:
             "sec-ch-ua-platform": "\"Windows\""
         }
         header2 = {
-            "Host": "v2.kwaicdn.com",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0",
             "Accept": "video/webm,video/ogg,video/*;q=0.9,application/ogg;q=0.7,audio/*;q=0.6,*/*;q=0.5",
             "Accept-Language": "zh-CN,zh;q=0.8,zh-TW;q=0.7,zh-HK;q=0.5,en-US;q=0.3,en;q=0.2",
@@ -58,54 +139,387 @@ class VideoMultiThreadDownloader:
             self.header = header1
         else:
             self.header = header2
+        # 大视频分段下载（仅流式下载时启用）
+        self.segmented = SegmentedDownloader(self.header, chunk_size=chunk_size, keyword=keyword) \
+            if stream and segmented else None
+        # 全局视频库
+        self.store = get_video_store() if VIDEO_STORE else None
+        # 下载清单，关键字已登记的视频计入上限
+        self.manifest = get_manifest() if DOWNLOAD_MANIFEST and keyword is not None else None
+        if self.manifest is not None:
+            self.video_num = self.manifest.count(platform, keyword)
+        # 本下载器中排队或下载中的视频id
+        self.queued_ids = set()
 
-    def download_control(self, option: str, /, video_t: tuple = None):
-        def download_video(video: tuple):
-            """
-            下载视频
-            @param video: 视频链接元组(视频id, 视频链接)
-            """
-
-            # 下载视频
-            with open(f"{self.save_path}\\{video[0]}.mp4", "wb+") as f:
-                f.write(requests.get(video[1], headers=self.header).content)
-                log_warn(
-                    f"下载视频{video[0]}.mp4成功",
-                )
-
-            # 下载结束，通知下载控制器
-            self.download_control("finish")
-
-        # 创建锁
-        lock = threading.RLock()
-        # 加锁
-        lock.acquire()
-        # 下载任务
-        if "download" == option and self.video_num < VIDEO_MAX_NUM:
-            # 判断线程池的任务数是否达到上限
-            if self.free_thread_num == 0:
-                # 将任务添加到任务队列末尾
-                self.video_download_task.append(video_t)
-            else:
-                # 线程池中的线程数减1
-                self.free_thread_num -= 1
-                # 异步执行下载任务
-                Thread(target=download_video,
-                       args=(video_t,)).start()
-                self.video_num += 1
+        self.workers = []
+        self._start_workers()
+        metrics.register(self)
 
-        # 下载结束
-        elif option == "finish" and self.video_num < VIDEO_MAX_NUM:
-            # 线程池中的线程数加1
-            self.free_thread_num += 1
-            # 判断任务队列是否为空
-            if len(self.video_download_task) != 0:
-                # 线程池中的线程数减1
-                self.free_thread_num -= 1
-
-                # 从任务队列中取出任务
-                Thread(target=download_video,
-                       args=(self.video_download_task.popleft(),)).start()
+    def _start_workers(self) -> None:
+        """启动常驻下载线程"""
+        for i in range(self.thread_num):
+            worker = Thread(target=self._worker, name=f"{self.platform}-downloader-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    @property
+    def free_thread_num(self) -> int:
+        """空闲线程数"""
+        with self.lock:
+            return self.thread_num - self.active_num
+
+    def stats(self) -> dict:
+        """下载统计"""
+        with self.lock:
+            elapsed = max(time.time() - self.start_time, 1e-6)
+            return {
+                "backend": type(self).__name__,
+                "finished": self.finished_num,
+                "failed": self.failed_num,
+                "skipped": self.skipped_num,
+                "bytes": self.bytes_num,
+                "elapsed": round(elapsed, 2),
+                "bytes_per_sec": round(self.bytes_num / elapsed),
+            }
+
+    def download_control(self, option: str, /, video_t: tuple = None, timeout: float = None):
+        """
+        下载控制入口
+        @param option: download 提交任务 / join 等待全部完成 / cancel 取消排队任务 / shutdown 关闭下载器
+        @param video_t: 视频链接元组(视频id, 视频链接)
+        @param timeout: 等待超时时间（秒），None表示一直等待
+        """
+        if option == "download":
+            return self.submit(video_t, timeout=timeout)
+        elif option == "join":
+            return self.join(timeout)
+        elif option == "cancel":
+            return self.cancel()
+        elif option == "shutdown":
+            return self.shutdown()
+        raise ValueError(f"unknown option: {option}")
+
+    def submit(self, video_t: tuple, timeout: float = None) -> bool:
+        """
+        提交下载任务，队列已满时阻塞等待
+        @param video_t: 视频链接元组(视频id, 视频链接)
+        @param timeout: 队列满时的等待时间（秒），None表示一直等待
+        @return: 是否加入了下载队列
+        """
+        with self.lock:
+            if not self._admit(video_t):
+                return False
+            self.pending_num += 1
+        try:
+            # 在锁外阻塞，避免卡住正在结束任务的线程
+            self.video_download_task.put(video_t, timeout=timeout)
+        except queue.Full:
+            with self.lock:
+                self.queued_ids.discard(video_t[0])
+                self._task_over()
+            log_warn(f"下载队列已满，视频{video_t[0]}留在清单中等待下次继续")
+            return False
+        return True
+
+    def _admit(self, video_t: tuple) -> bool:
+        """
+        判断是否接收下载任务，新视频登记到下载清单（需持有锁）
+        """
+        if self.closed or self.cancelled.is_set() or video_t[0] in self.queued_ids:
+            return False
+        if self.manifest is None:
+            if self.video_num >= VIDEO_MAX_NUM:
+                return False
+            self.video_num += 1
+        else:
+            state = self.manifest.state(self.platform, self.keyword, video_t[0])
+            if state == DONE:
+                return False
+            if state is None and self.video_num >= VIDEO_MAX_NUM:
+                return False
+            urls = [video_t[1]] if isinstance(video_t[1], str) else list(video_t[1])
+            if self.manifest.add(self.platform, self.keyword, video_t[0], urls, self.save_path):
                 self.video_num += 1
-        # 释放锁
-        lock.release()
+        self.queued_ids.add(video_t[0])
+        return True
+
+    def _task_started(self, video_t: tuple) -> bool:
+        """
+        任务开始
+        @return: 任务已取消或已被其他下载器领取时返回False（此时任务已结束）
+        """
+        if self.cancelled.is_set() or \
+                (self.manifest is not None and not self.manifest.claim(self.platform, self.keyword, video_t[0])):
+            with self.lock:
+                self.queued_ids.discard(video_t[0])
+                self._task_over()
+            return False
+        return True
+
+    def _task_finished(self, video_t: tuple, size: int = None, error: Exception = None) -> None:
+        """任务结束，更新计数、指标和下载清单"""
+        if error is not None:
+            log_warn(f"下载视频{video_t[0]}.mp4失败: {error}")
+            # 计入最后下载的主机（协程后端在换镜像时已按主机记录）
+            metrics.add(getattr(self.local, "host", None), self.keyword, failures=1)
+            if self.manifest is not None:
+                self.manifest.mark(self.platform, self.keyword, video_t[0], FAILED, error=str(error)[:500])
+        else:
+            metrics.add(keyword=self.keyword, files=1)
+            if self.manifest is not None:
+                self.manifest.mark(self.platform, self.keyword, video_t[0], DONE, size=size)
+        with self.lock:
+            if error is not None:
+                self.failed_num += 1
+            else:
+                self.finished_num += 1
+                self.bytes_num += size
+            self.queued_ids.discard(video_t[0])
+            self._task_over()
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        等待已提交的任务全部结束
+        @return: 超时返回False
+        """
+        with self.all_done:
+            return self.all_done.wait_for(lambda: self.pending_num == 0, timeout)
+
+    def cancel(self) -> int:
+        """
+        取消所有排队中的任务（正在下载的任务会继续完成）
+        @return: 被取消的任务数
+        """
+        self.cancelled.set()
+        num = 0
+        stops = 0
+        while True:
+            try:
+                video_t = self.video_download_task.get_nowait()
+            except queue.Empty:
+                break
+            if video_t is _STOP:
+                stops += 1
+            else:
+                num += 1
+                with self.lock:
+                    self.queued_ids.discard(video_t[0])
+                    self._task_over()
+            self.video_download_task.task_done()
+        # 放回shutdown已放入的退出标记，否则等待它们的线程不会退出
+        for _ in range(stops):
+            self.video_download_task.put(_STOP)
+        return num
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        关闭下载器：不再接收新任务，排队中的任务下载完后线程退出
+        @param wait: 是否等待线程退出
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        for _ in self.workers:
+            self.video_download_task.put(_STOP)
+        if wait:
+            for worker in self.workers:
+                worker.join()
+            if self.segmented is not None:
+                self.segmented.shutdown()
+            log_warn(format_connection_stats())
+            log_warn(f"下载统计 {self.stats()}")
+
+    def _task_over(self) -> None:
+        """任务结束（需持有锁）"""
+        self.pending_num -= 1
+        self.all_done.notify_all()
+
+    def _worker(self) -> None:
+        """常驻下载线程"""
+        while True:
+            video_t = self.video_download_task.get()
+            try:
+                if video_t is _STOP:
+                    return
+                if not self._task_started(video_t):
+                    continue
+                self.local.host = None
+                try:
+                    size = self.download_video(video_t)
+                except Exception as e:
+                    self._task_finished(video_t, error=e)
+                else:
+                    self._task_finished(video_t, size)
+            finally:
+                self.video_download_task.task_done()
+
+    def download_video(self, video: tuple) -> int:
+        """
+        下载视频，启用视频库时先查库，库中已有则直接链接到关键字文件夹
+        @param video: 视频链接元组(视频id, 视频链接或镜像链接列表)
+        @return: 本次下载的字节数
+        """
+        if self.store is None:
+            return self.fetch_adaptive(video, f"{self.save_path}\\{video[0]}.mp4")
+        with self.store.claim(self.platform, video[0]):
+            if self.store.has(self.platform, video[0]):
+                log_warn(f"视频{video[0]}.mp4已在视频库中，跳过下载")
+                with self.lock:
+                    self.skipped_num += 1
+                size = 0
+            else:
+                size = self.fetch_adaptive(video, self.store.path(self.platform, video[0]))
+                self.store.add(self.platform, video[0])
+        self.store.link(self.platform, video[0], self.save_path)
+        return size
+
+    def fetch_adaptive(self, video: tuple, path: str) -> int:
+        """
+        占用主机的一个并发名额后下载，下载结果反馈给自适应并发控制器：
+        先占用排名第一的镜像的主机，竞速或切换镜像后名额转到实际下载的主机（_use_host）
+        @return: 视频大小
+        """
+        urls = mirror_selector.rank([video[1]] if isinstance(video[1], str) else list(video[1]))
+        self.local.host = host_of(urls[0])
+        if self.adaptive is not None:
+            self.adaptive.acquire(self.local.host)
+        # 拿到名额后才算正在下载，等待名额的任务计入积压
+        with self.lock:
+            self.active_num += 1
+        size, congested = 0, False
+        try:
+            size = self.fetch_checked((video[0], urls), path)
+            return size
+        except Exception as e:
+            congested = is_congestion(e)
+            raise
+        finally:
+            with self.lock:
+                self.active_num -= 1
+            if self.adaptive is not None:
+                self.adaptive.release(self.local.host, size, congested)
+
+    def _use_host(self, url: str) -> None:
+        """记录实际下载的镜像，与占用名额的主机不同时把名额转过去"""
+        host = host_of(url)
+        if host != self.local.host:
+            if self.adaptive is not None:
+                self.adaptive.move(self.local.host, host)
+            self.local.host = host
+
+    def fetch_checked(self, video: tuple, path: str) -> int:
+        """
+        下载视频并立即校验：下载中断、大小不符或MP4不完整时，已写入的文件移入隔离区后重新下载，
+        重试用完仍失败时目标路径下不会留下不完整的文件
+        @return: 视频大小
+        """
+        for attempt in range(VALIDATE_RETRIES + 1):
+            try:
+                size, expected = self.fetch_video(video, path)
+            except OSError as e:
+                # requests的网络异常和镜像过慢（MirrorStalled）都是OSError
+                error, problem = e, f"下载中断: {e}"
+            else:
+                problem = self.check(path, size, expected)
+                if problem is None:
+                    return size
+                error = IOError(f"视频{video[0]}.mp4连续{VALIDATE_RETRIES + 1}次校验失败({problem})")
+            self.quarantine(video[0], path, problem)
+        raise error
+
+    @staticmethod
+    def check(path: str, size: int, expected: int):
+        """
+        检查下载好的视频
+        @param size: 写入的字节数
+        @param expected: 服务器声明的完整大小，未知时为-1
+        @return: 问题描述，文件完整时返回None
+        """
+        if VALIDATE_MP4:
+            return check_mp4(path, expected)
+        if expected >= 0 and size != expected:
+            return f"大小不符: {size}/{expected}"
+        return None
+
+    def quarantine(self, vid: str, path: str, problem: str) -> None:
+        """不完整的文件移入隔离区，不留在视频库或关键字文件夹中"""
+        metrics.add(keyword=self.keyword, retries=1)
+        if not os.path.exists(path):
+            log_warn(f"视频{vid}.mp4下载失败({problem})")
+            return
+        quarantine_dir = os.path.join(QUARANTINE_PATH, self.platform)
+        os.makedirs(quarantine_dir, exist_ok=True)
+        os.replace(path, os.path.join(quarantine_dir, f"{vid}-{int(time.time())}.mp4"))
+        log_warn(f"视频{vid}.mp4不完整({problem})，已移入隔离区")
+
+    def fetch_video(self, video: tuple, path: str) -> int:
+        """
+        下载视频到指定路径
+        @param video: 视频链接元组(视频id, 视频链接或镜像链接列表)
+        @param path: 保存路径
+        @return: (写入的字节数, 服务器声明的完整大小)，大小未知时为-1
+        """
+        urls = mirror_selector.rank([video[1]] if isinstance(video[1], str) else list(video[1]))
+        if not self.stream:
+            url, resp = mirror_selector.open_any(urls, self.header)
+            self._use_host(url)
+            with resp, open(path, "wb+") as f:
+                size = f.write(resp.content)
+            total = SegmentedDownloader.total_size(resp)
+        elif self.segmented is not None and self.segmented.has_progress(path):
+            # 上次中断的分段下载，从未完成的分段继续
+            size = total = self.segmented.download(urls, path)
+        else:
+            size, total = self.stream_to_file(urls, path)
+        log_warn(
+            f"下载视频{video[0]}.mp4成功",
+        )
+        return size, total
+
+    def stream_to_file(self, urls: list, path: str) -> int:
+        """
+        按块读取响应并直接写入文件，大视频转为分段下载；
+        当前镜像中断或速度过低时切换到下一个镜像，从已写入的位置继续
+        @param urls: 按延迟排序的镜像链接列表
+        @param path: 保存路径
+        @return: (写入的字节数, 服务器声明的完整大小)
+        """
+        # 有备用镜像时缩短读取超时，尽快发现卡住的镜像
+        timeout = (DOWNLOAD_TIMEOUT[0], MIRROR_STALL_TIMEOUT) if len(urls) > 1 else DOWNLOAD_TIMEOUT
+        url, resp = mirror_selector.open_any(urls, self.header, timeout)
+        self._use_host(url)
+        total = SegmentedDownloader.total_size(resp)
+        if self.segmented is not None and resp.status_code == 206 and total >= SEGMENT_MIN_SIZE:
+            # 复用这次请求探测到的大小，不再额外探测
+            resp.close()
+            return self.segmented.download([url] + [u for u in urls if u != url], path, total), total
+        size = 0
+        with open(path, "wb") as f:
+            while True:
+                try:
+                    with resp:
+                        # 只统计当前镜像的速度
+                        start, offset = time.time(), size
+                        for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            size += len(chunk)
+                            if len(urls) > 1:
+                                mirror_selector.check_speed(start, size - offset)
+                    metrics.add(host_of(url), self.keyword, bytes=size - offset, seconds=time.time() - start)
+                    return size, total
+                except (requests.RequestException, MirrorStalled) as e:
+                    mirror_selector.record_failure(url)
+                    metrics.add(host_of(url), self.keyword, bytes=size - offset, seconds=time.time() - start,
+                                retries=1)
+                    urls = [u for u in urls if u != url]
+                    if not urls:
+                        raise
+                    log_warn(f"镜像{mirror_selector.host(url)}中断({e})，从{size}字节处切换镜像")
+                    url, resp = mirror_selector.open_any(urls, dict(self.header, Range=f"bytes={size}-"), timeout)
+                    self._use_host(url)
+                    if resp.status_code != 206:
+                        # 新镜像不支持Range，从头写入
+                        f.seek(0)
+                        f.truncate()
+                        size = 0
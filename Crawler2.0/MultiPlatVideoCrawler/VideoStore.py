@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from MultiPlatVideoCrawler.conf.config import VIDEO_STORE_PATH
+
+
+class VideoStore:
+    """
+    全局视频库：每个视频按(平台, 视频id)只下载一次，入库时记录sha256，
+    各关键字的video文件夹里放硬链接（不支持硬链接时记录到videos.jsonl清单）
+    """
+
+    def __init__(self, root=VIDEO_STORE_PATH):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self.lock = threading.Lock()
+        # (平台, 视频id) -> {"platform", "vid", "sha256", "size"}
+        self.index = {}
+        # 本进程中已校验过哈希的视频
+        self.verified = set()
+        # 正在下载的视频 -> 下载结束事件
+        self.inflight = {}
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 崩溃时写了一半的最后一行
+                        continue
+                    self.index[(entry["platform"], entry["vid"])] = entry
+        except FileNotFoundError:
+            pass
+
+    def path(self, platform: str, vid: str) -> str:
+        """视频在库中的路径"""
+        return os.path.join(self.root, platform, f"{vid}.mp4")
+
+    @staticmethod
+    def sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def has(self, platform: str, vid: str) -> bool:
+        """
+        视频是否已在库中：检查文件大小，每个视频在本进程中第一次命中时再校验一次哈希
+        """
+        key = (platform, vid)
+        with self.lock:
+            entry = self.index.get(key)
+            verified = key in self.verified
+        if entry is None:
+            return False
+        path = self.path(platform, vid)
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return False
+        except OSError:
+            return False
+        if not verified:
+            if self.sha256(path) != entry["sha256"]:
+                return False
+            with self.lock:
+                self.verified.add(key)
+        return True
+
+    def add(self, platform: str, vid: str) -> dict:
+        """
+        把已下载到库路径的视频登记入库
+        @return: 索引记录
+        """
+        path = self.path(platform, vid)
+        entry = {"platform": platform, "vid": vid, "sha256": self.sha256(path), "size": os.path.getsize(path)}
+        with self.lock:
+            self.index[(platform, vid)] = entry
+            self.verified.add((platform, vid))
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def link(self, platform: str, vid: str, dest_dir: str) -> None:
+        """
+        把库中的视频放进关键字的video文件夹
+        @param dest_dir: 关键字的video文件夹
+        """
+        src = self.path(platform, vid)
+        dest = os.path.join(dest_dir, f"{vid}.mp4")
+        if os.path.exists(dest):
+            return
+        try:
+            os.link(src, dest)
+        except OSError:
+            # 跨盘或文件系统不支持硬链接，只记录清单
+            entry = self.index[(platform, vid)]
+            with self.lock:
+                with open(os.path.join(dest_dir, "videos.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(dict(entry, path=src), ensure_ascii=False) + "\n")
+
+    @contextmanager
+    def claim(self, platform: str, vid: str):
+        """
+        独占下载某个视频，其他线程在同一视频上等待，避免不同关键字同时下载同一视频
+        """
+        key = (platform, vid)
+        while True:
+            with self.lock:
+                event = self.inflight.get(key)
+                if event is None:
+                    event = self.inflight[key] = threading.Event()
+                    break
+            event.wait()
+        os.makedirs(os.path.dirname(self.path(platform, vid)), exist_ok=True)
+        try:
+            yield
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            event.set()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_video_store() -> VideoStore:
+    """获取全局视频库"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = VideoStore()
+    return _store
@@ -13,6 +13,174 @@ DouYinDataSavePath = f"{PROJECT_PATH}\data-douyin"
 KuaiShowDataSavePath = f"{PROJECT_PATH}\data-kuaishou"
 
 VIDEO_MAX_NUM = 20
+# 下载任务队列容量（队列满时提交任务会阻塞，直到有线程空闲）
+DOWNLOAD_QUEUE_SIZE = 500
+# 是否流式下载视频（按块写入文件，单个线程最多占用一个块的内存）
+DOWNLOAD_STREAM = True
+# 流式下载的块大小（字节）
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 下载超时时间（连接超时, 读取超时）秒
+DOWNLOAD_TIMEOUT = (10, 30)
+# 是否对大视频使用分段并行下载（支持断点续传）
+DOWNLOAD_SEGMENTED = True
+# 超过该大小（字节）的视频才分段下载
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+# 每段大小（字节）
+SEGMENT_SIZE = 2 * 1024 * 1024
+# 每个下载器用于分段下载的线程数
+SEGMENT_THREAD_NUM = 4
+
+# 共享连接池：缓存的主机连接池个数
+HTTP_POOL_CONNECTIONS = 32
+# 共享连接池：每个主机保持的最大连接数
+HTTP_POOL_MAXSIZE = 10
+# 单独设置连接池大小的主机（视频CDN需要容纳下载线程与分段线程）
+HTTP_HOST_POOL_SIZE = {
+    "v26-web.douyinvod.com": 20,
+    "v3-web.douyinvod.com": 20,
+    "v2.kwaicdn.com": 20,
+    "v1.kwaicdn.com": 20,
+}
+# DNS缓存时间（秒），0表示不缓存
+HTTP_DNS_CACHE_TTL = 300
+# DNS缓存最多保存的主机数
+HTTP_DNS_CACHE_SIZE = 256
+
+# 下载后端：thread 多线程 / async 协程(aiohttp)
+DOWNLOAD_BACKEND = "thread"
+# 协程后端同时进行的下载数
+ASYNC_DOWNLOAD_CONCURRENCY = 300
+
+# 同时竞速请求的镜像数（抖音download_addr.url_list）
+MIRROR_RACE_NUM = 2
+# 有备用镜像时，超过该时间（秒）没有数据或速度过低就切换镜像
+MIRROR_STALL_TIMEOUT = 8
+# 镜像最低下载速度（字节/秒）
+MIRROR_MIN_SPEED = 32 * 1024
+
+# 是否启用全局视频库（同一视频只下载一次，各关键字文件夹中放硬链接）
+VIDEO_STORE = True
+# 全局视频库路径
+VIDEO_STORE_PATH = f"{PROJECT_PATH}\\video-store"
+
+# 下载指标文件路径
+METRICS_PATH = f"{PROJECT_PATH}\\metrics\\downloader.json"
+# 指标写入间隔（秒），0表示不定期写入
+METRICS_FLUSH_INTERVAL = 10
+
+# 按主机限速：主机 -> (每秒请求数, 突发请求数)，None表示不限速
+# douyin-browser/kuaishou-browser 是浏览器翻到下一个视频的最快节奏（平时等评论到达即翻页）
+HOST_RATE_LIMITS = {
+    "v26-web.douyinvod.com": (20, 40),
+    "v3-web.douyinvod.com": (20, 40),
+    "v2.kwaicdn.com": (20, 40),
+    "v1.kwaicdn.com": (20, 40),
+    "www.piyao.org.cn": (1, 3),
+    "chinafactcheck.com": (2, 4),
+    "api.factpaper.cn": (5, 10),
+    "www.douyin.com": (5, 10),
+    "www.kuaishou.com": (5, 10),
+    "douyin-browser": (1, 2),
+    "kuaishou-browser": (1, 2),
+}
+# 未单独配置的主机的限速
+DEFAULT_RATE_LIMIT = (10, 20)
+
+# 是否使用下载清单（SQLite）记录每个视频的下载状态，重启后继续未完成的下载
+DOWNLOAD_MANIFEST = True
+# 下载清单路径
+MANIFEST_PATH = f"{PROJECT_PATH}\\state\\manifest.db"
+# 每个视频最多尝试下载的次数
+DOWNLOAD_MAX_ATTEMPTS = 3
+
+# 下载完成后是否立即检查MP4完整性（大小、ftyp/moov）
+VALIDATE_MP4 = True
+# 一次下载任务中校验失败后立即重新下载的次数
+VALIDATE_RETRIES = 2
+# 校验失败的文件移到这里
+QUARANTINE_PATH = f"{PROJECT_PATH}\\quarantine"
+
+# 是否按主机自适应调整下载并发数（AIMD：吞吐量上升时加1，超时、403/429或吞吐量下降时按比例减小）
+DOWNLOAD_ADAPTIVE = True
+# 每个主机的最小/最大/初始并发数（最大值不宜超过HTTP_HOST_POOL_SIZE）
+AIMD_MIN_CONCURRENCY = 2
+AIMD_MAX_CONCURRENCY = 20
+AIMD_INIT_CONCURRENCY = 4
+# 吞吐量统计窗口（秒），每个窗口最多调整一次
+AIMD_WINDOW = 5
+
+# 代理钩子只复制流量数据，由后台线程解析和保存：线程数、队列容量（队列满时钩子丢弃流量）
+FLOW_WORKER_NUM = 4
+FLOW_QUEUE_SIZE = 1000
+
+# 评论按视频合并后批量追加到{视频id}.jsonl：攒够多少条或隔多少秒写一次
+COMMENT_FLUSH_SIZE = 200
+COMMENT_FLUSH_INTERVAL = 5
+
+# 同时搜索的浏览器数量，每个浏览器领取不同的关键字
+SEARCH_WORKER_NUM = 2
+# 第一个浏览器的代理端口，其余浏览器依次加1（mitmdump同时监听这些端口）
+SEARCH_PROXY_PORT = 8080
+# 点开视频后等待代理收到评论的最长时间（秒），收到即翻到下一个视频
+COMMENT_WAIT_TIMEOUT = 5
+# 等待页面元素出现的最长时间（秒）
+PAGE_WAIT_TIMEOUT = 15
+
+# 是否复用浏览器第一页评论请求的请求头和cookie，直接请求后续评论分页
+COMMENT_REPLAY = True
+# 同时直接请求评论的视频数
+COMMENT_REPLAY_CONCURRENCY = 4
+# 每个视频最多直接请求的评论分页数
+COMMENT_REPLAY_MAX_PAGES = 50
+# 快手是否把评论分页、搜索分页的请求合并成批量GraphQL请求（JSON数组，接口不支持时自动改为逐个请求），
+# 并在搜索结果到达时直接请求其中视频的评论，浏览器不用逐个点开视频
+KUAISHOU_BATCH = True
+# 每次请求最多合并的操作数
+KUAISHOU_BATCH_SIZE = 10
+# 凑满一批最多等待的秒数
+KUAISHOU_BATCH_WAIT = 0.05
+
+# 流量控制：积压超过高水位时浏览器暂停翻页，降到低水位以下再继续
+# 所有下载器中排队未开始的视频数（每个浏览器的关键字最多提交VIDEO_MAX_NUM个视频，
+# 积压超过所有浏览器一半的视频时暂停，降到四分之一以下再继续）
+DOWNLOAD_BACKLOG_HIGH = VIDEO_MAX_NUM * SEARCH_WORKER_NUM // 2
+DOWNLOAD_BACKLOG_LOW = VIDEO_MAX_NUM * SEARCH_WORKER_NUM // 4
+# 尚未写入文件的评论数
+COMMENT_PENDING_HIGH = 5000
+COMMENT_PENDING_LOW = 1000
+# 流量处理队列中等待解析的流量数
+FLOW_BACKLOG_HIGH = 500
+FLOW_BACKLOG_LOW = 100
+# 暂停时检查积压的间隔（秒）
+FLOW_CONTROL_INTERVAL = 0.5
+# 最长暂停时间（秒），超过后即使积压未降下来也继续翻页
+FLOW_CONTROL_MAX_PAUSE = 300
+
+# 是否只解密接口主机的TLS：其他主机（视频CDN、图片、脚本、字体）由mitmdump直接转发，不生成flow、不经过插件
+PROXY_INTERCEPT_ONLY_API = True
+# 各平台需要解密的接口主机（与AutoSlider.registerRoutes注册的路由主机一致）
+INTERCEPT_HOSTS = {
+    "douyin": ["www.douyin.com"],
+    "kuaishou": ["www.kuaishou.com"],
+}
+
+# 视频旁路保存：浏览器播放搜索结果中的视频时，代理把经过的视频数据直接写入视频库，这些视频不再下载；
+# 搜索结果中的视频在关键字结束时才交给下载器，只下载浏览器没有播放过的。需要VIDEO_STORE，并重新运行start.py
+VIDEO_CAPTURE = False
+# 需要解密的视频CDN主机，以.开头表示该域名下的所有主机
+VIDEO_CAPTURE_HOSTS = {
+    "douyin": [".douyinvod.com"],
+    "kuaishou": [".kwaicdn.com"],
+}
+# 关键字结束时等待正在写入的视频的最长时间（秒）
+VIDEO_CAPTURE_WAIT = 10
+# 校验和入库的线程数
+VIDEO_CAPTURE_THREAD_NUM = 2
+
+# 是否把拦截到的接口流量（链接、请求体、响应体）记录到文件，用于离线回放测试：python -m benchmark.flow_replay
+FLOW_RECORD = False
+# 流量记录文件路径
+FLOW_RECORD_PATH = f"{PROJECT_PATH}\\recordings\\flows.jsonl"
 # 浏览器用户文件路径
 # --------------只改这个-------------------
 Profile_dir = r"C:\Users\CHALN\AppData\Roaming\Mozilla\Firefox\Profiles\bl883mpl.default-release-1"
@@ -0,0 +1,124 @@
+# 自适应并发（AIMD）：吞吐量上升时每个统计窗口把主机并发数加1，
+# 超时、403/429或吞吐量下降时按比例减小
+import threading
+import time
+
+from MultiPlatVideoCrawler.conf.config import AIMD_MIN_CONCURRENCY, AIMD_MAX_CONCURRENCY, AIMD_INIT_CONCURRENCY, \
+    AIMD_WINDOW
+from MultiPlatVideoCrawler.utils.metrics import metrics
+
+
+class HostConcurrency:
+    """单个主机的并发控制状态（由AIMDController的锁保护）"""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        # 当前窗口内完成的字节数
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        # 上一个窗口的吞吐量（字节/秒）
+        self.last_rate = None
+        self.last_backoff = 0.0
+
+
+class AIMDController:
+
+    # 吞吐量下降时的缩小比例
+    DECREASE = 0.7
+    # 超时、403/429时的缩小比例
+    CONGESTION_DECREASE = 0.5
+    # 吞吐量下降超过该比例才缩小
+    TOLERANCE = 0.1
+
+    def __init__(self, min_limit=AIMD_MIN_CONCURRENCY, max_limit=AIMD_MAX_CONCURRENCY, init_limit=AIMD_INIT_CONCURRENCY,
+                 window=AIMD_WINDOW):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.init_limit = init_limit
+        self.window = window
+        self.hosts = {}
+        self.cond = threading.Condition()
+
+    def _host(self, host: str) -> HostConcurrency:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostConcurrency(self.init_limit)
+        return state
+
+    def try_acquire(self, host: str) -> bool:
+        """并发数未满时占用一个名额"""
+        with self.cond:
+            state = self._host(host)
+            if state.in_flight < int(state.limit):
+                state.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, host: str) -> None:
+        """阻塞直到主机有空闲的并发名额"""
+        with self.cond:
+            state = self._host(host)
+            self.cond.wait_for(lambda: state.in_flight < int(state.limit))
+            state.in_flight += 1
+
+    def move(self, old_host: str, new_host: str) -> None:
+        """镜像竞速或切换后实际下载的主机变了，名额转到新主机（新主机可能暂时超出并发数）"""
+        with self.cond:
+            self._host(old_host).in_flight -= 1
+            self._host(new_host).in_flight += 1
+            self.cond.notify_all()
+
+    def release(self, host: str, size: int = 0, congested: bool = False) -> None:
+        """
+        释放名额并根据结果调整并发数
+        @param size: 下载的字节数
+        @param congested: 是否遇到超时、403/429等拥塞信号
+        """
+        with self.cond:
+            state = self._host(host)
+            state.in_flight -= 1
+            now = time.monotonic()
+            if congested:
+                # 同一窗口内只退避一次，避免一批失败把并发数压到最低
+                if now - state.last_backoff > self.window:
+                    state.limit = max(self.min_limit, state.limit * self.CONGESTION_DECREASE)
+                    state.last_backoff = now
+                    state.last_rate = None
+            else:
+                state.window_bytes += size
+            elapsed = now - state.window_start
+            if elapsed >= self.window:
+                rate = state.window_bytes / elapsed
+                if not congested:
+                    if state.last_rate is None or rate >= state.last_rate * (1 - self.TOLERANCE):
+                        state.limit = min(self.max_limit, state.limit + 1)
+                    else:
+                        state.limit = max(self.min_limit, state.limit * self.DECREASE)
+                state.last_rate = rate
+                state.window_bytes = 0
+                state.window_start = now
+            self.cond.notify_all()
+
+    def snapshot(self) -> dict:
+        """每个主机当前的目标并发数、进行中的下载数和上一个窗口的吞吐量"""
+        with self.cond:
+            return {host: {"target_concurrency": round(s.limit, 2),
+                           "in_flight": s.in_flight,
+                           "bytes_per_sec": round(s.last_rate) if s.last_rate is not None else None}
+                    for host, s in self.hosts.items()}
+
+
+def is_congestion(error: Exception) -> bool:
+    """超时、连接失败和403/429视为拥塞信号"""
+    import requests
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    return status in (403, 429)
+
+
+# 全局控制器，所有下载器按主机共用
+aimd = AIMDController()
+metrics.register_gauge("aimd", aimd.snapshot)
@@ -0,0 +1,77 @@
+# 评论和搜索接口的快速解析：安装了orjson时用orjson解码，否则用标准库json，
+# 只取出需要的字段（评论内容/点赞数、视频id/下载链接），不构造中间结果
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 当前使用的解码器名称
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """解码JSON，data可以是bytes或str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def douyin_comment_page(body) -> tuple:
+    """
+    抖音评论接口 aweme/v1/web/comment/list/
+    @return: (视频id, [(评论id, {"text": 评论, "digg_count": 点赞数})], 下一页游标, 是否还有下一页)，
+             没有评论时视频id为None
+    """
+    data = loads(body)
+    comments = data.get('comments') or []
+    aweme_id = comments[0]['aweme_id'] if comments else None
+    return aweme_id, [(c.get('cid'), {"text": c['text'], "digg_count": c['digg_count']}) for c in comments], \
+        data.get('cursor'), bool(data.get('has_more'))
+
+
+def douyin_search_videos(body) -> list:
+    """
+    抖音搜索接口 aweme/v1/web/general/search/single/
+    @return: [(视频id, 下载镜像链接列表, 播放镜像链接列表)]，跳过没有视频的结果（用户卡片、话题等）
+    """
+    videos = []
+    for item in loads(body).get('data') or []:
+        info = item.get('aweme_info')
+        if not info:
+            continue
+        try:
+            video = info['video']
+            play_addr = video.get('play_addr') or {}
+            videos.append((info['aweme_id'], video['download_addr']['url_list'], play_addr.get('url_list') or []))
+        except (KeyError, TypeError, AttributeError):
+            continue
+    return videos
+
+
+def kuaishou_comment_page(body) -> tuple:
+    """
+    快手GraphQL commentListQuery
+    @return: ([(评论id, {"text": 评论, "digg_count": 点赞数})], 下一页游标)，没有下一页时游标为None
+    """
+    comment_list = loads(body)['data']['visionCommentList']
+    comments = comment_list['rootComments'] or []
+    pcursor = comment_list.get('pcursor')
+    return [(c.get('commentId'), {"text": c['content'], "digg_count": c['likedCount']}) for c in comments], \
+        pcursor if pcursor and pcursor != "no_more" else None
+
+
+def kuaishou_search_page(body) -> tuple:
+    """
+    快手GraphQL visionSearchPhoto
+    @return: ([(视频id, 视频链接)], 下一页游标)，没有下一页时游标为None
+    """
+    search = loads(body)['data']['visionSearchPhoto']
+    videos = []
+    for feed in search['feeds'] or []:
+        photo = feed.get('photo')
+        if photo and 'id' in photo and 'photoUrl' in photo:
+            videos.append((photo['id'], photo['photoUrl']))
+    pcursor = search.get('pcursor')
+    return videos, pcursor if pcursor and pcursor != "no_more" else None
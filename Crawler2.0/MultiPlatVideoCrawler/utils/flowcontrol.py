@@ -0,0 +1,96 @@
+# 搜索与下载/评论写入之间的流量控制：任一积压超过高水位时暂停浏览器翻页，降到低水位以下再继续
+import threading
+import time
+
+from MultiPlatVideoCrawler.conf.config import FLOW_CONTROL_INTERVAL, FLOW_CONTROL_MAX_PAUSE
+from MultiPlatVideoCrawler.utils.log import log_warn
+
+
+class Backlog:
+
+    def __init__(self, name: str, func, high: int, low: int, relieve=None):
+        """
+        @param func: 返回当前积压的函数
+        @param high: 高水位，超过时暂停
+        @param low: 低水位，降到此值以下才继续
+        @param relieve: 暂停期间主动消化积压的函数（如把评论写入文件），None表示只等待
+        """
+        self.name = name
+        self.func = func
+        self.high = high
+        self.low = low
+        self.relieve = relieve
+        self.over = False
+
+
+class FlowControl:
+    """
+    高低水位之间保持原状态（滞回），避免积压在高水位附近时浏览器频繁暂停、继续
+    """
+
+    def __init__(self, interval=FLOW_CONTROL_INTERVAL, max_pause=FLOW_CONTROL_MAX_PAUSE):
+        """
+        @param interval: 暂停时检查积压的间隔（秒）
+        @param max_pause: 最长暂停时间（秒），积压不再减少时不会一直卡住浏览器
+        """
+        self.interval = interval
+        self.max_pause = max_pause
+        self.lock = threading.Lock()
+        self.backlogs = []
+        self.pause_num = 0
+        self.paused_seconds = 0.0
+
+    def add(self, name: str, func, high: int, low: int, relieve=None) -> None:
+        with self.lock:
+            self.backlogs.append(Backlog(name, func, high, low, relieve))
+
+    def check(self) -> list:
+        """
+        重新计算积压
+        @return: 超过水位的积压名称，空列表表示可以继续
+        """
+        with self.lock:
+            for backlog in self.backlogs:
+                value = backlog.func()
+                if backlog.over:
+                    backlog.over = value > backlog.low
+                else:
+                    backlog.over = value > backlog.high
+            return [backlog.name for backlog in self.backlogs if backlog.over]
+
+    def wait(self, name: str = "") -> float:
+        """
+        积压超过水位时阻塞，直到全部降到低水位以下或超过最长暂停时间
+        @param name: 等待者名称，用于日志
+        @return: 暂停的秒数
+        """
+        over = self.check()
+        if not over:
+            return 0.0
+        log_warn(f"{name}暂停翻页，积压超过高水位: {', '.join(over)}")
+        start = time.time()
+        while over:
+            with self.lock:
+                relieves = [b.relieve for b in self.backlogs if b.over and b.relieve is not None]
+            for relieve in relieves:
+                relieve()
+            if time.time() - start >= self.max_pause:
+                log_warn(f"{name}暂停超过{self.max_pause}秒，积压仍未降到低水位: {', '.join(over)}")
+                break
+            time.sleep(self.interval)
+            over = self.check()
+        paused = time.time() - start
+        with self.lock:
+            self.pause_num += 1
+            self.paused_seconds += paused
+        log_warn(f"{name}继续翻页，暂停{paused:.1f}秒")
+        return paused
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "pauses": self.pause_num,
+                "paused_seconds": round(self.paused_seconds, 1),
+                "backlogs": {b.name: {"value": b.func(), "high": b.high, "low": b.low, "over": b.over}
+                             for b in self.backlogs},
+            }
@@ -0,0 +1,198 @@
+# 共享HTTP连接池：下载器和网站爬虫共用同一个Session，同一主机的请求复用TCP+TLS连接
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+from MultiPlatVideoCrawler.conf.config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_HOST_POOL_SIZE, \
+    HTTP_DNS_CACHE_TTL, HTTP_DNS_CACHE_SIZE
+from MultiPlatVideoCrawler.utils.ratelimit import rate_limiter
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class CountingAdapter(HTTPAdapter):
+    """按主机限速，并统计每个主机的请求数，用于计算连接复用率"""
+
+    def __init__(self, *args, **kwargs):
+        self.request_count = {}
+        self.count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        if HTTP_DNS_CACHE_TTL > 0:
+            # 只有这个Session的新连接使用DNS缓存，不影响进程中的其他代码（如mitmproxy）
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": CachedDNSHTTPConnectionPool,
+                "https": CachedDNSHTTPSConnectionPool,
+            }
+
+    def send(self, request, *args, **kwargs):
+        host = urlsplit(request.url).hostname
+        rate_limiter.acquire(host)
+        with self.count_lock:
+            self.request_count[host] = self.request_count.get(host, 0) + 1
+        return super().send(request, *args, **kwargs)
+
+    def connection_count(self) -> dict:
+        """每个主机新建的连接数"""
+        count = {}
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                count[pool.host] = count.get(pool.host, 0) + pool.num_connections
+        return count
+
+
+class DNSCache:
+    """带过期时间和容量上限的域名解析缓存，避免每个新连接都重新解析域名"""
+
+    def __init__(self, ttl: float, max_size: int):
+        """
+        @param ttl: 解析结果的有效时间（秒）
+        @param max_size: 最多缓存的主机数，超过时淘汰最久未使用的
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        # (主机, 端口) -> (过期时间, [IP])
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host: str, port: int) -> list:
+        """
+        @return: 主机的IP列表（按系统解析的顺序）
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            item = self.cache.get(key)
+            if item is not None and item[0] > now:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return item[1]
+        addresses = []
+        for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = (now + self.ttl, addresses)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return addresses
+
+    def invalidate(self, host: str, port: int) -> None:
+        """连接失败时丢弃缓存的解析结果"""
+        with self.lock:
+            self.cache.pop((host, port), None)
+
+
+dns_cache = DNSCache(HTTP_DNS_CACHE_TTL, HTTP_DNS_CACHE_SIZE)
+
+
+class CachedDNSMixin:
+    """新建连接时用缓存的IP连接，TLS的SNI和证书校验仍使用原主机名"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = dns_cache.resolve(host, self.port)
+        except OSError:
+            # 解析失败时按原方式连接，由urllib3报告解析错误
+            return super()._new_conn()
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        # 缓存的IP都连不上，下次重新解析
+        dns_cache.invalidate(host, self.port)
+        if error is None:
+            return super()._new_conn()
+        raise error
+
+
+class CachedDNSHTTPConnection(CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSHTTPConnection
+
+
+class CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    session.adapters.clear()
+    # 默认连接池
+    for prefix in ("https://", "http://"):
+        session.mount(prefix, CountingAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE))
+    # 单独配置连接池大小的主机
+    for host, size in HTTP_HOST_POOL_SIZE.items():
+        for prefix in (f"https://{host}/", f"http://{host}/"):
+            session.mount(prefix, CountingAdapter(pool_connections=1, pool_maxsize=size))
+    return session
+
+
+def get_session() -> requests.Session:
+    """获取全局共享的Session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def connection_stats() -> dict:
+    """
+    连接复用统计
+    @return: {主机: {"requests": 请求数, "connections": 新建连接数, "reused": 复用连接的请求数}}
+    """
+    stats = {}
+    if _session is None:
+        return stats
+    for adapter in set(_session.adapters.values()):
+        connections = adapter.connection_count()
+        with adapter.count_lock:
+            request_count = dict(adapter.request_count)
+        for host, requests_num in request_count.items():
+            item = stats.setdefault(host, {"requests": 0, "connections": 0, "reused": 0})
+            item["requests"] += requests_num
+            item["connections"] += connections.get(host, 0)
+    for item in stats.values():
+        item["reused"] = max(item["requests"] - item["connections"], 0)
+    return stats
+
+
+def format_connection_stats() -> str:
+    """连接复用统计的单行摘要"""
+    parts = []
+    for host, item in sorted(connection_stats().items()):
+        parts.append(f"{host} {item['reused']}/{item['requests']}")
+    return f"连接复用(复用/请求) {', '.join(parts)}; DNS缓存命中 {dns_cache.hits}/{dns_cache.hits + dns_cache.misses}"
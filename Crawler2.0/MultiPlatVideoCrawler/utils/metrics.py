@@ -0,0 +1,139 @@
+# 下载指标：按CDN主机和关键字统计吞吐量、首字节延迟、重试和失败，定期写入文件
+import json
+import os
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+from MultiPlatVideoCrawler.conf.config import METRICS_PATH, METRICS_FLUSH_INTERVAL
+from MultiPlatVideoCrawler.utils.log import log_warn
+
+# 累加型指标
+COUNTERS = ("bytes", "seconds", "files", "ttfb_sum", "ttfb_count", "retries", "failures")
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname
+
+
+class DownloadMetrics:
+
+    def __init__(self, path=METRICS_PATH, interval=METRICS_FLUSH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.keywords = {}
+        # 已注册的下载器，用于读取队列深度和活动线程数
+        self.downloaders = weakref.WeakSet()
+        # 其他模块注册的额外状态，名称 -> 返回字典的函数
+        self.gauges = {}
+        self.start_time = time.time()
+        self.flusher = None
+
+    def add(self, host: str = None, keyword=None, **values) -> None:
+        """
+        累加指标
+        @param host: CDN主机，None表示不计入主机维度
+        @param keyword: 关键字id，None表示不计入关键字维度
+        @param values: bytes/seconds/files/ttfb_sum/ttfb_count/retries/failures
+        """
+        with self.lock:
+            for table, key in ((self.hosts, host), (self.keywords, keyword)):
+                if key is None:
+                    continue
+                item = table.get(key)
+                if item is None:
+                    item = table[key] = dict.fromkeys(COUNTERS, 0)
+                for name, value in values.items():
+                    item[name] += value
+
+    def ttfb(self, url: str, seconds: float) -> None:
+        """记录一次首字节延迟"""
+        self.add(host_of(url), ttfb_sum=seconds, ttfb_count=1)
+
+    def register(self, downloader) -> None:
+        """注册下载器并启动定期写文件的线程"""
+        self.downloaders.add(downloader)
+        if self.flusher is None and self.interval > 0:
+            self.flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self.flusher.start()
+
+    def register_gauge(self, name: str, func) -> None:
+        self.gauges[name] = func
+
+    def download_backlog(self) -> int:
+        """所有下载器中已提交但还没开始下载的视频数"""
+        backlog = 0
+        for d in list(self.downloaders):
+            with d.lock:
+                backlog += d.pending_num - d.active_num
+        return backlog
+
+    @staticmethod
+    def _derive(item: dict) -> dict:
+        item = dict(item)
+        item["bytes_per_sec"] = round(item["bytes"] / item["seconds"]) if item["seconds"] else 0
+        item["ttfb_ms"] = round(item["ttfb_sum"] / item["ttfb_count"] * 1000) if item["ttfb_count"] else None
+        return item
+
+    def snapshot(self) -> dict:
+        downloaders = []
+        for d in list(self.downloaders):
+            with d.lock:
+                downloaders.append({
+                    "platform": d.platform,
+                    "keyword": d.keyword,
+                    "queue_depth": d.pending_num - d.active_num,
+                    "active_workers": d.active_num,
+                    "threads": d.thread_num,
+                })
+        with self.lock:
+            hosts = {k: self._derive(v) for k, v in self.hosts.items()}
+            keywords = {str(k): self._derive(v) for k, v in self.keywords.items()}
+        gauges = {}
+        for name, func in list(self.gauges.items()):
+            gauges[name] = func()
+        return {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "uptime": round(time.time() - self.start_time, 1),
+            "queue_depth": sum(d["queue_depth"] for d in downloaders),
+            "active_workers": sum(d["active_workers"] for d in downloaders),
+            "downloaders": downloaders,
+            "hosts": hosts,
+            "keywords": keywords,
+            "gauges": gauges,
+        }
+
+    def flush(self) -> None:
+        """写入指标文件（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                log_warn(f"写入下载指标失败: {e!r}")
+
+    def summary(self) -> str:
+        """关闭时打印的摘要"""
+        snapshot = self.snapshot()
+        lines = [f"下载指标（运行{snapshot['uptime']}秒）"]
+        for host, item in sorted(snapshot["hosts"].items()):
+            lines.append(f"  {host}: {item['bytes'] / 1024 / 1024:.1f}MB {item['bytes_per_sec'] / 1024:.0f}KB/s "
+                         f"首字节{item['ttfb_ms']}ms 重试{item['retries']} 失败{item['failures']}")
+        files = sum(item["files"] for item in snapshot["keywords"].values())
+        failures = sum(item["failures"] for item in snapshot["keywords"].values())
+        lines.append(f"  共{len(snapshot['keywords'])}个关键字 成功{files}个视频 失败{failures}个")
+        return "\n".join(lines)
+
+
+# 全局指标
+metrics = DownloadMetrics()
@@ -0,0 +1,49 @@
+# MP4文件完整性检查：只读取顶层box的头部，不解析视频内容
+import os
+import struct
+
+
+def check_mp4(path: str, expected_size: int = -1):
+    """
+    检查MP4文件是否完整
+    @param path: 文件路径
+    @param expected_size: 服务器声明的大小（Content-Length），未知时为-1
+    @return: 问题描述，文件完整时返回None
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        return f"文件不存在: {e}"
+    if size == 0:
+        return "空文件"
+    if expected_size >= 0 and size != expected_size:
+        return f"大小不符: {size}/{expected_size}"
+
+    boxes = []
+    offset = 0
+    with open(path, "rb") as f:
+        while offset + 8 <= size:
+            f.seek(offset)
+            box_size, box_type = struct.unpack(">I4s", f.read(8))
+            if box_size == 1:
+                # 64位大小
+                large_size = f.read(8)
+                if len(large_size) != 8:
+                    return f"文件被截断: 偏移{offset}的box头不完整"
+                box_size = struct.unpack(">Q", large_size)[0]
+                if box_size < 16:
+                    return f"box损坏: 偏移{offset}"
+            elif box_size == 0:
+                # 一直延伸到文件末尾
+                box_size = size - offset
+            if box_size < 8:
+                return f"box损坏: 偏移{offset}"
+            boxes.append(box_type)
+            offset += box_size
+    if offset != size:
+        return f"文件被截断: 最后一个box结束于{offset}，文件大小{size}"
+    if not boxes or boxes[0] != b"ftyp":
+        return "缺少ftyp"
+    if b"moov" not in boxes:
+        return "缺少moov"
+    return None
@@ -0,0 +1,83 @@
+# 按主机限速：每个主机一个令牌桶，下载器、网站爬虫和浏览器翻页共用
+import threading
+import time
+from urllib.parse import urlsplit
+
+from MultiPlatVideoCrawler.conf.config import HOST_RATE_LIMITS, DEFAULT_RATE_LIMIT
+
+
+class TokenBucket:
+    """
+    令牌桶：每秒补充rate个令牌，最多积攒burst个
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        预定令牌（令牌数可以暂时为负）
+        @return: 需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        阻塞直到拿到令牌
+        @return: 实际等待的秒数
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """主机 -> 令牌桶，未单独配置的主机使用默认速率"""
+
+    def __init__(self, limits=None, default=DEFAULT_RATE_LIMIT):
+        self.limits = dict(HOST_RATE_LIMITS if limits is None else limits)
+        self.default = default
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url_or_host: str):
+        """
+        @return: 主机的令牌桶，不限速的主机返回None
+        """
+        host = urlsplit(url_or_host).hostname if "://" in url_or_host else url_or_host
+        with self.lock:
+            bucket = self.buckets.get(host, False)
+            if bucket is False:
+                limit = self.limits.get(host, self.default)
+                bucket = self.buckets[host] = TokenBucket(*limit) if limit else None
+            return bucket
+
+    def acquire(self, url_or_host: str, tokens: float = 1) -> float:
+        """
+        按主机限速，阻塞直到拿到令牌
+        @param url_or_host: 链接或主机名
+        @return: 实际等待的秒数
+        """
+        bucket = self.bucket(url_or_host)
+        return bucket.acquire(tokens) if bucket is not None else 0.0
+
+    def reserve(self, url_or_host: str, tokens: float = 1) -> float:
+        """预定令牌，返回需要等待的秒数（供协程使用asyncio.sleep等待）"""
+        bucket = self.bucket(url_or_host)
+        return bucket.reserve(tokens) if bucket is not None else 0.0
+
+
+# 全局限速器
+rate_limiter = RateLimiter()
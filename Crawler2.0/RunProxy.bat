@@ -1 +1 @@
-mitmdump -p 8080 -s C:\Users\CHALN\Desktop\github\-\Crawler2.0\Proxy.py --flow-detail 0
\ No newline at end of file
+mitmdump --mode regular@8080 --mode regular@8081 --allow-hosts "^(www\.douyin\.com|www\.kuaishou\.com)(:[0-9]+)?$" -s C:\Users\CHALN\Desktop\github\-\Crawler2.0\Proxy.py --flow-detail 0
\ No newline at end of file
@@ -0,0 +1,154 @@
+# 代理插件的离线回放：把FlowRecorder记录的接口流量（配置FLOW_RECORD=True后正常运行一次得到）按指定速率交给
+# AutoSlider.response，不启动浏览器、不访问网络，统计吞吐量、各路由的处理耗时和写出的文件，用于比较解析和保存逻辑的改动
+# 用法（在Crawler2.0目录下）：
+#   python -m benchmark.flow_replay douyin                                  回放FLOW_RECORD_PATH，尽快回放
+#   python -m benchmark.flow_replay kuaishou -f <记录文件> -r 50 -o <输出目录>   每秒回放50条
+# 回放时不直接请求后续评论分页，视频只统计提交数不下载
+import argparse
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import MultiPlatVideoCrawler.AutoSlider as autoslider
+from MultiPlatVideoCrawler.CrawlCheckpoint import CrawlCheckpoint
+from MultiPlatVideoCrawler.FlowRecorder import FlowRecorder
+from MultiPlatVideoCrawler.conf.config import FLOW_RECORD_PATH
+
+
+class ReplayRequest:
+
+    def __init__(self, item: dict):
+        parts = urlsplit(item["url"])
+        self.url = item["url"]
+        self.host = parts.hostname
+        self.path = parts.path + (f"?{parts.query}" if parts.query else "")
+        self.method = item.get("method") or "GET"
+        self.headers = item.get("request_headers") or {}
+        self.content = item["request"]
+
+
+class ReplayResponse:
+
+    def __init__(self, item: dict):
+        self.raw_content = item["response"]
+        self.headers = {"content-encoding": item["content_encoding"]} if item.get("content_encoding") else {}
+
+
+class ReplayClientConn:
+
+    def __init__(self, port: int):
+        self.sockname = ("127.0.0.1", port)
+
+
+class ReplayFlow:
+    """与mitmproxy的flow结构相同，只包含AutoSlider.response用到的字段"""
+
+    def __init__(self, item: dict, port: int):
+        self.request = ReplayRequest(item)
+        self.response = ReplayResponse(item)
+        self.client_conn = ReplayClientConn(port)
+        # 旁路保存的视频写入器由responseheaders放在这里，回放的接口流量没有
+        self.metadata = {}
+
+
+class ReplayDownloader:
+    """代替视频下载器，只统计提交的视频"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.videos = []
+
+    def download_control(self, option: str, /, video_t: tuple = None, timeout: float = None):
+        if option == "download":
+            with self.lock:
+                self.videos.append(video_t[0])
+        return True
+
+
+def list_files(path: str) -> dict:
+    """目录下的文件 -> 大小"""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            file = os.path.join(root, name)
+            files[file] = os.path.getsize(file)
+    return files
+
+
+def replay(platform: str, path: str, rate: float, out: str) -> dict:
+    """
+    回放记录的流量
+    @param rate: 每秒交给钩子的流量数，0表示尽快
+    @param out: 评论和断点的输出目录
+    @return: 统计结果
+    """
+    items = list(FlowRecorder.read(path))
+    # 不启动浏览器，不访问网络，不读关键字文件；评论和断点只写到输出目录，视频都交给ReplayDownloader统计
+    os.makedirs(out, exist_ok=True)
+    slider = autoslider.AutoSlider(platform, keywords=[], save_path=out,
+                                   checkpoint=CrawlCheckpoint(os.path.join(out, "checkpoint.db")), offline=True)
+    slider.isStart = True
+    before = list_files(out)
+
+    downloaders = {}
+    hook_seconds = 0.0
+    start = time.perf_counter()
+    for i, item in enumerate(items):
+        if rate > 0:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        keyword = item.get("keyword")
+        worker = slider.scheduler.worker_for_port(item.get("port")) or slider.scheduler.workers[0]
+        if keyword != worker.keyword:
+            os.makedirs(f"{out}\\{keyword}\\comments", exist_ok=True)
+            worker.switch(keyword, downloaders.setdefault(keyword, ReplayDownloader()))
+        hook_start = time.perf_counter()
+        slider.response(ReplayFlow(item, worker.port))
+        hook_seconds += time.perf_counter() - hook_start
+    # 等后台线程处理完并写出评论
+    slider.drainFlows()
+    slider.comments.finalize()
+    elapsed = time.perf_counter() - start
+    slider.pipeline.shutdown()
+
+    after = list_files(out)
+    written = {file: size for file, size in after.items() if before.get(file) != size}
+    return {
+        "flows": len(items),
+        "seconds": elapsed,
+        "flows_per_sec": len(items) / elapsed if elapsed else 0,
+        "hook_us": hook_seconds / len(items) * 1e6 if items else 0,
+        "routes": slider.router.stats(),
+        "pipeline": slider.pipeline.stats(),
+        "videos": sum(len(d.videos) for d in downloaders.values()),
+        "files": len(written),
+        "bytes": sum(written.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放记录的代理流量")
+    parser.add_argument("platform", choices=("douyin", "kuaishou"))
+    parser.add_argument("-f", "--file", default=FLOW_RECORD_PATH, help="FlowRecorder记录的jsonl")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="每秒回放的流量数，0表示尽快")
+    parser.add_argument("-o", "--out", default=None, help="输出目录，默认使用临时目录")
+    args = parser.parse_args()
+    out = args.out or tempfile.mkdtemp(prefix="flow-replay-")
+
+    result = replay(args.platform, args.file, args.rate, out)
+    print(f"回放{result['flows']}条流量，用时{result['seconds']:.2f}秒，{result['flows_per_sec']:.1f}条/秒，"
+          f"钩子平均{result['hook_us']:.1f}us")
+    print(f"{'路由':<20}{'次数':>8}{'平均(ms)':>10}{'失败':>6}")
+    for name, item in sorted(result["routes"].items()):
+        print(f"{name:<20}{item['count']:>8}{item['avg_ms']:>10}{item['failures']:>6}")
+    pipeline = result["pipeline"]
+    print(f"流量队列：处理{pipeline['processed']} 失败{pipeline['failed']} 丢弃{pipeline['dropped']} "
+          f"捕获到处理完平均{pipeline['latency_ms']}ms")
+    print(f"提交下载{result['videos']}个视频，写出{result['files']}个文件 {result['bytes'] / 1024:.1f}KB（{out}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# 评论/搜索接口解析的微基准：比较标准库json完整解码与utils.fastjson（orjson+只取字段）
+# 用法（在Crawler2.0目录下）：
+#   python -m benchmark.json_bench                 使用生成的样本
+#   python -m benchmark.json_bench <样本目录>        使用抓取的响应体，文件名以接口类型开头，
+#                                                  如 douyin-comment-1.json、kuaishou-search-3.json
+import json
+import os
+import random
+import string
+import sys
+import time
+
+from MultiPlatVideoCrawler.utils import fastjson
+
+KINDS = ("douyin-comment", "douyin-search", "kuaishou-comment", "kuaishou-search")
+
+
+def _text(n: int) -> str:
+    return "".join(random.choice(string.ascii_letters + "评论视频辟谣") for _ in range(n))
+
+
+def _user() -> dict:
+    """接口中每条评论/视频都带着的用户信息，占响应体的大部分"""
+    return {
+        "uid": str(random.getrandbits(60)),
+        "nickname": _text(12),
+        "signature": _text(80),
+        "avatar_thumb": {"uri": _text(40), "url_list": [f"https://p3.douyinpic.com/{_text(60)}" for _ in range(3)]},
+        "cover_url": [{"uri": _text(40), "url_list": [f"https://p9.douyinpic.com/{_text(60)}" for _ in range(3)]}],
+        "follow_status": 0,
+        "custom_verify": "",
+        "ip_location": "北京",
+    }
+
+
+def sample_payloads() -> dict:
+    """生成与真实接口结构相近的样本"""
+    random.seed(1)
+    douyin_comment = {"comments": [{
+        "cid": str(random.getrandbits(60)), "aweme_id": "7300000000000000000", "text": _text(60),
+        "digg_count": random.randint(0, 10000), "create_time": 1700000000, "user": _user(),
+        "reply_comment": None, "label_list": [{"type": 1, "text": _text(6)}], "ip_label": "北京",
+    } for _ in range(20)], "cursor": 20, "has_more": 1, "total": 500,
+        "extra": {"now": 1700000000, "fatal_item_ids": []}, "log_pb": {"impr_id": _text(30)}}
+    douyin_search = {"data": [{"type": 1, "aweme_info": {
+        "aweme_id": str(random.getrandbits(60)), "desc": _text(100), "author": _user(),
+        "music": {"title": _text(20), "play_url": {"url_list": [f"https://sf3.douyinvod.com/{_text(60)}"]}},
+        "video": {"download_addr": {"url_list": [f"https://v26-web.douyinvod.com/{_text(120)}" for _ in range(3)]},
+                  "play_addr": {"url_list": [f"https://v3-web.douyinvod.com/{_text(120)}" for _ in range(3)]},
+                  "bit_rate": [{"gear_name": _text(10), "play_addr": {"url_list": [_text(120)] * 3}}
+                               for _ in range(4)],
+                  "cover": {"url_list": [_text(100)] * 3}},
+        "statistics": {"digg_count": 1, "comment_count": 2, "share_count": 3},
+        "text_extra": [{"hashtag_name": _text(8)} for _ in range(5)],
+    }} for _ in range(10)], "has_more": 1, "cursor": 10, "log_pb": {"impr_id": _text(30)}}
+    kuaishou_comment = {"data": {"visionCommentList": {"commentCount": 500, "pcursor": "20", "rootComments": [{
+        "commentId": str(random.getrandbits(50)), "authorId": str(random.getrandbits(40)),
+        "authorName": _text(10), "content": _text(60), "headurl": f"https://p2.a.yximgs.com/{_text(80)}",
+        "timestamp": 1700000000000, "likedCount": random.randint(0, 10000), "realLikedCount": 1,
+        "liked": False, "status": 0, "subCommentCount": 2, "subCommentsPcursor": "no_more",
+        "subComments": [{"commentId": _text(12), "content": _text(40), "authorName": _text(10)}] * 2,
+    } for _ in range(20)]}}}
+    kuaishou_search = {"data": {"visionSearchPhoto": {"result": 1, "pcursor": "1", "feeds": [{
+        "type": 1, "author": {"id": _text(12), "name": _text(10), "headerUrl": _text(100)},
+        "photo": {"id": _text(15), "caption": _text(100), "likeCount": "1万", "duration": 15000,
+                  "photoUrl": f"https://v2.kwaicdn.com/{_text(150)}",
+                  "coverUrl": _text(150), "videoResource": {"h264": {"adaptationSet": [
+                      {"representation": [{"url": _text(150), "backupUrl": [_text(150)]}] * 3}]}}},
+    } for _ in range(20)]}}}
+    return {
+        "douyin-comment": [json.dumps(douyin_comment, ensure_ascii=False).encode()],
+        "douyin-search": [json.dumps(douyin_search, ensure_ascii=False).encode()],
+        "kuaishou-comment": [json.dumps(kuaishou_comment, ensure_ascii=False).encode()],
+        "kuaishou-search": [json.dumps(kuaishou_search, ensure_ascii=False).encode()],
+    }
+
+
+def load_payloads(path: str) -> dict:
+    """读取目录中抓取的响应体"""
+    payloads = {kind: [] for kind in KINDS}
+    for name in sorted(os.listdir(path)):
+        for kind in KINDS:
+            if name.startswith(kind):
+                with open(os.path.join(path, name), "rb") as f:
+                    payloads[kind].append(f.read())
+    return {kind: bodies for kind, bodies in payloads.items() if bodies}
+
+
+def stdlib_extract(kind: str, body: bytes):
+    """原来的写法：标准库完整解码后取字段（取出与处理函数相同的字段）"""
+    data = json.loads(body.decode("utf-8"))
+    if kind == "douyin-comment":
+        comments = data['comments']
+        return comments[0]['aweme_id'] if comments else None, \
+            [(c['cid'], {"text": c['text'], "digg_count": c['digg_count']}) for c in comments], \
+            data['cursor'], bool(data['has_more'])
+    if kind == "douyin-search":
+        return [(v['aweme_info']['aweme_id'], v['aweme_info']['video']['download_addr']['url_list'],
+                 v['aweme_info']['video']['play_addr']['url_list']) for v in data['data']]
+    if kind == "kuaishou-comment":
+        comment_list = data['data']['visionCommentList']
+        return [(c['commentId'], {"text": c['content'], "digg_count": c['likedCount']})
+                for c in comment_list['rootComments']], comment_list['pcursor']
+    search = data['data']['visionSearchPhoto']
+    return [(v['photo']['id'], v['photo']['photoUrl']) for v in search['feeds']], search['pcursor']
+
+
+# AutoSlider的处理函数实际调用的解析函数
+FAST_EXTRACT = {
+    "douyin-comment": fastjson.douyin_comment_page,
+    "douyin-search": fastjson.douyin_search_videos,
+    "kuaishou-comment": fastjson.kuaishou_comment_page,
+    "kuaishou-search": fastjson.kuaishou_search_page,
+}
+
+
+def bench(func, bodies: list, seconds: float = 1.0) -> float:
+    """
+    @return: 每个响应体的平均耗时（微秒）
+    """
+    num = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for body in bodies:
+            func(body)
+        num += len(bodies)
+    return (time.perf_counter() - start) / num * 1e6
+
+
+def main():
+    payloads = load_payloads(sys.argv[1]) if len(sys.argv) > 1 else sample_payloads()
+    print(f"fastjson后端: {fastjson.BACKEND}")
+    print(f"{'接口':<18}{'平均大小':>10}{'json(us)':>12}{'fastjson(us)':>14}{'加速':>8}")
+    for kind, bodies in payloads.items():
+        size = sum(len(b) for b in bodies) / len(bodies)
+        slow = bench(lambda b: stdlib_extract(kind, b), bodies)
+        fast = bench(FAST_EXTRACT[kind], bodies)
+        print(f"{kind:<18}{size / 1024:>8.1f}KB{slow:>12.1f}{fast:>14.1f}{slow / fast:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """
 删除空视频
+下载器已在下载完成时校验视频（VALIDATE_MP4），本脚本只用于清理开启校验之前下载的数据
 """
 import os
 import numpy as np
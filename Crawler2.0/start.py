@@ -1,16 +1,29 @@
 import os
 
-from MultiPlatVideoCrawler.conf.config import PROJECT_PATH, ProxyFilePath
+from MultiPlatVideoCrawler.FlowRouter import host_pattern
+from MultiPlatVideoCrawler.conf.config import PROJECT_PATH, ProxyFilePath, SEARCH_PROXY_PORT, SEARCH_WORKER_NUM, \
+    PROXY_INTERCEPT_ONLY_API, INTERCEPT_HOSTS, VIDEO_CAPTURE, VIDEO_CAPTURE_HOSTS
 
 
-def start_mitmdump(port=8080) -> None:
+def start_mitmdump(port=SEARCH_PROXY_PORT, worker_num=SEARCH_WORKER_NUM, only_api=PROXY_INTERCEPT_ONLY_API) -> None:
     """
     启动mitmdump
-    @param port: 端口号
+    @param port: 第一个端口号
+    @param worker_num: 浏览器数量，每个浏览器使用一个端口
+    @param only_api: 是否只解密接口主机的TLS
     """
+    # 每个浏览器一个监听端口，插件按端口区分流量属于哪个浏览器
+    modes = " ".join(f"--mode regular@{port + i}" for i in range(max(1, worker_num)))
+    # 视频CDN、图片等主机不解密，直接转发（旁路保存视频时还要解密视频CDN）
+    allow = ""
+    if only_api:
+        hosts = [h for hosts in INTERCEPT_HOSTS.values() for h in hosts]
+        if VIDEO_CAPTURE:
+            hosts += [h for hosts in VIDEO_CAPTURE_HOSTS.values() for h in hosts]
+        allow = f' --allow-hosts "{host_pattern(hosts)}"'
     # 打开抓包工具
     with open(f"{PROJECT_PATH}\RunProxy.bat", 'w') as f:
-        f.write(f"mitmdump -p {port} -s {ProxyFilePath} --flow-detail 0")
+        f.write(f"mitmdump {modes}{allow} -s {ProxyFilePath} --flow-detail 0")
     os.system(f"start {PROJECT_PATH}\RunProxy.bat")
 
 
@@ -4,6 +4,10 @@
 import json
 import requests
 
+from MultiPlatVideoCrawler.utils.http import get_session
+
+session = get_session()
+
 # 1.ȡcontent1.json
 with open("./content/content1.json", "r", encoding="utf-8") as f:
     content = json.load(f)
@@ -33,7 +37,7 @@ with open("./content/content1.json", "r", encoding="utf-8") as f:
             }
             try:
                 a = json.loads(
-                    requests.post(url, headers=header, data=json.dumps(data)).text.encode('gbk', 'ignore').decode('gbk'))[
+                    session.post(url, headers=header, data=json.dumps(data)).text.encode('gbk', 'ignore').decode('gbk'))[
                     'data']
             except requests.exceptions.ConnectTimeout as e:
                 continue
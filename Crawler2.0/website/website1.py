@@ -3,8 +3,10 @@ import re
 import json
 import jieba
 from MultiPlatVideoCrawler.conf.config import PROJECT_PATH
+from MultiPlatVideoCrawler.utils.http import get_session
 
 if __name__ == '__main__':
+    session = get_session()
     header = {
         "Host": "api.factpaper.cn",
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/118.0",
@@ -26,7 +28,7 @@ if __name__ == '__main__':
     url = "https://api.factpaper.cn/fact-check/front/proveList"
 
     data = {"pageNum": 1, "pageSize": 450, "status": 1}
-    response = requests.post(url, headers=header, data=json.dumps(data))
+    response = session.post(url, headers=header, data=json.dumps(data))
     with open(f"{PROJECT_PATH}\keywords\keywords.json", "a+", encoding="utf-8") as f:
         cc = []
         keyword = []
@@ -59,7 +61,7 @@ if __name__ == '__main__':
             data = {"proveId": item['proveId']}
             try:
                 a = json.loads(
-                    requests.post(host, headers=header, data=json.dumps(data)).text.encode('gbk', 'ignore').decode('gbk'))[
+                    session.post(host, headers=header, data=json.dumps(data)).text.encode('gbk', 'ignore').decode('gbk'))[
                     'data']
             except requests.exceptions.ConnectTimeout as e:
                 continue
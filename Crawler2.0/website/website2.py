@@ -5,6 +5,7 @@ from bs4 import BeautifulSoup as bs
 import requests
 
 from MultiPlatVideoCrawler.conf.config import PROJECT_PATH
+from MultiPlatVideoCrawler.utils.http import get_session
 
 header = {
     "Host": "chinafactcheck.com",
@@ -26,6 +27,7 @@ header = {
     "TE": "trailers"
 }
 PAGE_NUM = 2  # max 50
+session = get_session()
 
 with open(f"{PROJECT_PATH}\keywords\keywords.json", "a+", encoding="utf-8") as f:
     keyword = []
@@ -34,7 +36,7 @@ with open(f"{PROJECT_PATH}\keywords\keywords.json", "a+", encoding="utf-8") as f
     order = 0
     for page in range(1, PAGE_NUM + 1):
         url = f"https://chinafactcheck.com/?paged={page}"
-        response = requests.get(url, headers=header)
+        response = session.get(url, headers=header)
         soup = bs(response.text, "html.parser")
         pattern = re.compile(r'<.*?>')
 
@@ -60,7 +62,7 @@ with open(f"{PROJECT_PATH}\keywords\keywords.json", "a+", encoding="utf-8") as f
         if b.startswith("https://chinafactcheck.com/"):
             print(b)
             try:
-                resp = requests.get(b, headers={
+                resp = session.get(b, headers={
                 "Host": "chinafactcheck.com",
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0",
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
@@ -3,12 +3,12 @@ import json
 import time
 from os.path import exists
 
-import requests
 from playwright.sync_api import sync_playwright
-from time import sleep
 import bs4
 import urllib3
 
+from MultiPlatVideoCrawler.utils.http import get_session
+
 
 def join_url(url):
     """ 拼接url """
@@ -33,6 +33,7 @@ def getTimeFromUrl(url):
 
 
 if __name__ == '__main__':
+    session = get_session()
     # 获取网页源代码
     header = {
         "Host": "www.piyao.org.cn",
@@ -52,7 +53,7 @@ if __name__ == '__main__':
         "Cache-Control": "no-cache"
     }
 
-    resp = requests.get("https://www.piyao.org.cn/rm/bd.htm", headers=header).text.encode('gbk', 'ignore')
+    resp = session.get("https://www.piyao.org.cn/rm/bd.htm", headers=header).text.encode('gbk', 'ignore')
     html = bs4.BeautifulSoup(resp, 'html.parser')
     a = html.find_all("a", {"target": "_blank"})
     urls = []
@@ -85,7 +86,7 @@ if __name__ == '__main__':
         keywords = []
         index = 0
         for i in urls:
-            resp = requests.get(i, headers=header).content
+            resp = session.get(i, headers=header).content
             html = bs4.BeautifulSoup(resp, 'html.parser')
             content = html.find_all("p")
             flag = False
@@ -110,7 +111,6 @@ if __name__ == '__main__':
                         index += 1
                         continue
                     with open(f"./content/content3/{700 + index}.jpg", "wb") as f1:
-                        f1.write(requests.get(src).content)
+                        f1.write(session.get(src).content)
                     index += 1
-            sleep(2)
         json.dump(keywords, f, indent=4, skipkeys=True, ensure_ascii=False)
@@ -1,13 +1,13 @@
 import json
 from os.path import exists
-from time import sleep
 
 import bs4
-import requests
 
+from MultiPlatVideoCrawler.utils.http import get_session
 from website.website3 import join_url
 
 if __name__ == '__main__':
+    session = get_session()
     # 获取网页源代码
     header = {
         "Host": "www.piyao.org.cn",
@@ -26,7 +26,7 @@ if __name__ == '__main__':
         "Pragma": "no-cache",
         "Cache-Control": "no-cache"
     }
-    html = requests.get("https://www.piyao.org.cn/jrpy/index.htm", headers=header).text.encode('gbk', 'ignore')
+    html = session.get("https://www.piyao.org.cn/jrpy/index.htm", headers=header).text.encode('gbk', 'ignore')
     html = bs4.BeautifulSoup(html, 'html.parser')
     a = html.find_all("a", {"target": "_blank"})
     urls = []
@@ -41,7 +41,7 @@ if __name__ == '__main__':
 
         for i in urls:
             print(i)
-            htm = requests.get(i, headers=header).content
+            htm = session.get(i, headers=header).content
             htm = bs4.BeautifulSoup(htm, 'html.parser')
             p = htm.find_all("p")
 
@@ -88,6 +88,4 @@ if __name__ == '__main__':
                         order += 1
                 s += 1
 
-            sleep(2)
-
         json.dump(keywords, f, ensure_ascii=False, indent=4)